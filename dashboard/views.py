@@ -3,13 +3,18 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.db.models import Count, Sum, Q
 from shop.models import Product, Order, OrderItem, Size
+from shop.recommendations import record_order_status_change, get_recommendation_cache_stats
+from shop.catalog_io import detect_format, export_rows, import_products, read_rows, render_rows
 from dog.models import Dog, DogImage
 from dog.emails import send_listing_approved
+from outbox.mail import enqueue_email
 from decimal import Decimal
+import csv
+import io
 
 # Context processor for notification counts
 def get_notification_counts():
@@ -50,6 +55,7 @@ def dashboard_home(request):
         'pending_dogs': pending_dogs,
         'recent_orders': recent_orders,
         'total_revenue': total_revenue,
+        'recommendation_cache': get_recommendation_cache_stats(),
         **get_notification_counts(),
     }
     return render(request, 'dashboard/home.html', context)
@@ -170,6 +176,41 @@ def product_delete(request, product_id):
     })
 
 
+@staff_member_required
+def product_import(request):
+    """Import products from an uploaded CSV / JSON catalog"""
+    if request.method == 'POST':
+        upload = request.FILES.get('catalog')
+        fmt = detect_format(upload.name) if upload else None
+        if fmt is None:
+            messages.error(request, 'Please upload a .csv, .jsonl or .json catalog file.')
+        else:
+            try:
+                stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+                result = import_products(read_rows(stream, fmt), settings.CATALOG_IMAGE_DIR)
+            except (ValueError, UnicodeDecodeError, csv.Error) as e:
+                # Unreadable file (bad encoding, broken CSV/JSON); re-show the form
+                messages.error(request, f'Error importing catalog: {str(e)}')
+            else:
+                messages.success(request, f'Catalog imported: {result}.')
+                for number, message in result.errors[:20]:
+                    messages.warning(request, f'Row {number}: {message}')
+                return redirect('dashboard:product_list')
+
+    return render(request, 'dashboard/product_import.html', {
+        'image_dir': settings.CATALOG_IMAGE_DIR,
+        **get_notification_counts(),
+    })
+
+
+@staff_member_required
+def product_export(request):
+    """Download the whole catalog as CSV"""
+    response = StreamingHttpResponse(render_rows(export_rows(), 'csv'), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="products.csv"'
+    return response
+
+
 # ==================== DOG MANAGEMENT ====================
 
 @staff_member_required
@@ -210,11 +251,8 @@ def dog_approve(request, dog_id):
         
         # Send approval email if checkbox is checked
         if send_email:
-            try:
-                send_listing_approved(dog, admin_message=message)
-                messages.success(request, f'Dog listing "{dog.name}" approved and email sent!')
-            except Exception as e:
-                messages.warning(request, f'Dog approved but email failed: {str(e)}')
+            send_listing_approved(dog, admin_message=message)
+            messages.success(request, f'Dog listing "{dog.name}" approved and email queued!')
         else:
             messages.success(request, f'Dog listing "{dog.name}" approved!')
         
@@ -260,17 +298,8 @@ Best regards,
 The Pethood Team
             """
             
-            try:
-                send_mail(
-                    subject,
-                    email_message,
-                    settings.DEFAULT_FROM_EMAIL,
-                    [dog.lister.email],
-                    fail_silently=False,
-                )
-                messages.success(request, f'Dog listing "{dog.name}" rejected and email sent.')
-            except Exception as e:
-                messages.warning(request, f'Dog rejected but email failed: {str(e)}')
+            enqueue_email(subject, email_message, [dog.lister.email])
+            messages.success(request, f'Dog listing "{dog.name}" rejected and email queued.')
         else:
             messages.success(request, f'Dog listing "{dog.name}" rejected.')
         
@@ -309,17 +338,8 @@ Best regards,
 The Pethood Team
             """
             
-            try:
-                send_mail(
-                    subject,
-                    email_message,
-                    settings.DEFAULT_FROM_EMAIL,
-                    [dog.lister.email],
-                    fail_silently=False,
-                )
-                messages.success(request, f'Dog "{dog.name}" marked as adopted and email sent!')
-            except Exception as e:
-                messages.warning(request, f'Dog marked as adopted but email failed: {str(e)}')
+            enqueue_email(subject, email_message, [dog.lister.email])
+            messages.success(request, f'Dog "{dog.name}" marked as adopted and email queued!')
         else:
             messages.success(request, f'Dog "{dog.name}" marked as adopted!')
         
@@ -418,8 +438,10 @@ def order_detail(request, order_id):
         
         if new_status and new_status in dict(Order.STATUS_CHOICES):
             old_status = order.get_status_display()
+            previous_status = order.status
             order.status = new_status
             order.save()
+            record_order_status_change(order, previous_status)
             
             # Send status update email if checkbox is checked
             if send_email:
@@ -438,17 +460,8 @@ Best regards,
 The Pethood Team
                 """
                 
-                try:
-                    send_mail(
-                        subject,
-                        email_message,
-                        settings.DEFAULT_FROM_EMAIL,
-                        [order.email],
-                        fail_silently=False,
-                    )
-                    messages.success(request, f'Order status updated to "{order.get_status_display()}" and email sent!')
-                except Exception as e:
-                    messages.warning(request, f'Status updated but email failed: {str(e)}')
+                enqueue_email(subject, email_message, [order.email])
+                messages.success(request, f'Order status updated to "{order.get_status_display()}" and email queued!')
             else:
                 messages.success(request, f'Order status updated to "{order.get_status_display()}"!')
             
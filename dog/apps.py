@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class DogConfig(AppConfig):
     name = 'dog'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -1,8 +1,8 @@
-from django.core.mail import send_mail, EmailMultiAlternatives
-from django.conf import settings
 from django.contrib.auth.models import User
 from django.template.loader import render_to_string
 
+from outbox.mail import enqueue_email
+
 
 def send_new_listing_to_admin(dog):
     """Notify admin when new dog listing is submitted"""
@@ -28,10 +28,7 @@ def send_new_listing_to_admin(dog):
     Pethood
     """
     
-    try:
-        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, list(admin_emails), fail_silently=False)
-    except Exception as e:
-        print(f"Email error: {e}")
+    enqueue_email(subject, message, admin_emails)
 
 
 def send_listing_approved(dog, admin_message=''):
@@ -72,15 +69,5 @@ The Pethood Team
     }
     html_content = render_to_string('emails/dog_approval.html', context)
     
-    try:
-        # Create email with both plain text and HTML versions
-        email = EmailMultiAlternatives(
-            subject=subject,
-            body=text_content,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[dog.lister.email]
-        )
-        email.attach_alternative(html_content, "text/html")
-        email.send(fail_silently=False)
-    except Exception as e:
-        print(f"Email error: {e}")
+    # Queue with both plain text and HTML versions
+    enqueue_email(subject, text_content, [dog.lister.email], html_body=html_content)
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from shop.catalog import bump_version
+
+from userauth.models import Address
+
+from .models import Dog, DogImage
+
+
+@receiver(post_save, sender=Dog)
+@receiver(post_delete, sender=Dog)
+@receiver(post_save, sender=DogImage)
+@receiver(post_delete, sender=DogImage)
+def dog_changed(sender, instance, **kwargs):
+    bump_version('adoption')
+
+
+@receiver(post_save, sender=Address)
+@receiver(post_delete, sender=Address)
+def address_changed(sender, instance, **kwargs):
+    """The lister's default phone number is shown on their dogs' pages."""
+    bump_version('adoption')
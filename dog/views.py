@@ -1,13 +1,17 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db.models import Q
 from .models import Dog, DogImage
 from .forms import DogListingForm, DogImageForm
 from .emails import send_new_listing_to_admin
 from userauth.models import Address
+from shop.conditional import conditional_page
+from shop.fuzzy import correct_phrase, words_of
 
 # Create your views here.
 
+@conditional_page('adoption')
 def dog_list(request):
     """Display all approved dogs available for adoption with filters"""
     dogs = Dog.objects.filter(is_adopted=False, is_approved=True)
@@ -23,7 +27,12 @@ def dog_list(request):
         dogs = dogs.filter(gender=gender)
     
     if breed:
-        dogs = dogs.filter(breed__icontains=breed)
+        # Also match the closest known spelling ("golden retreiver")
+        breed_filter = Q(breed__icontains=breed)
+        corrected_breed = correct_phrase(breed, 'adoption')
+        if corrected_breed and corrected_breed != ' '.join(words_of(breed)):
+            breed_filter |= Q(breed__icontains=corrected_breed)
+        dogs = dogs.filter(breed_filter)
     
     if location:
         dogs = dogs.filter(location__icontains=location)
@@ -54,6 +63,7 @@ def dog_list(request):
     return render(request, 'dog_list.html', context)
 
 @login_required
+@conditional_page('adoption')
 def dog_detail(request, slug):
     """Display detailed information about a specific dog (login required)"""
     # Staff members can view unapproved dogs, regular users can only view approved ones
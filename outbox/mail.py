@@ -0,0 +1,133 @@
+"""
+Email outbox.
+
+Views call enqueue_email(), which only inserts a row, so it commits or rolls
+back with whatever else the view wrote and never waits on the mail server.
+The send_outbox worker claims due rows in batches and sends them over one
+SMTP connection. A failed message is retried with exponential backoff until
+EMAIL_OUTBOX_MAX_ATTEMPTS, or given up at once if the server refuses it
+permanently (a 5xx reply).
+
+Claiming sets a random token on the rows with a conditional UPDATE, so two
+workers never take the same message. The claim expires after CLAIM_LEASE,
+which puts the messages of a worker that died mid-batch back in the queue.
+"""
+import random
+import smtplib
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+CLAIM_LEASE = timedelta(minutes=5)
+MAX_RETRY_DELAY = timedelta(hours=6)
+
+
+def enqueue_email(subject, body, to, html_body='', from_email=None):
+    """Queue a message for the send_outbox worker."""
+    return OutgoingEmail.objects.create(
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(to),
+    )
+
+
+def due_emails(now=None):
+    now = now or timezone.now()
+    return OutgoingEmail.objects.filter(
+        Q(status='pending') | Q(status='sending'),
+        next_attempt_at__lte=now,
+    )
+
+
+def claim_due_emails(batch_size):
+    """Claim up to `batch_size` due messages for this worker and return them."""
+    now = timezone.now()
+    ids = list(due_emails(now).order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+
+    token = uuid.uuid4().hex
+    # Rows another worker claimed in the meantime no longer match the filter
+    due_emails(now).filter(id__in=ids).update(status='sending', claim=token, next_attempt_at=now + CLAIM_LEASE)
+    return list(OutgoingEmail.objects.filter(id__in=ids, claim=token, status='sending').order_by('id'))
+
+
+def retry_delay(attempts):
+    """Backoff before the next attempt: the base delay doubled per attempt, with jitter."""
+    # Cap the seconds before making a timedelta, which overflows long before 2**attempts does
+    seconds = min(settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY.total_seconds())
+    return timedelta(seconds=seconds) * random.uniform(0.8, 1.2)
+
+
+def is_permanent(error):
+    """Whether the server rejected the message for good, so retrying is pointless."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+
+def record_failure(email, error):
+    email.attempts += 1
+    email.last_error = f"{type(error).__name__}: {error}"[:2000]
+    email.claim = ''
+    if is_permanent(error) or email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = 'failed'
+    else:
+        email.status = 'pending'
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+    email.save(update_fields=['attempts', 'last_error', 'claim', 'status', 'next_attempt_at'])
+
+
+def send_emails(emails, connection):
+    """
+    Send claimed messages over `connection`, which is opened if needed and
+    left open for the next batch. Returns (sent, failed).
+    """
+    try:
+        connection.open()  # No-op when already open
+    except Exception as e:
+        for email in emails:
+            record_failure(email, e)
+        return 0, len(emails)
+
+    sent = failed = 0
+    for email in emails:
+        message = EmailMultiAlternatives(
+            subject=email.subject,
+            body=email.body,
+            from_email=email.from_email,
+            to=email.to,
+            connection=connection,
+        )
+        if email.html_body:
+            message.attach_alternative(email.html_body, 'text/html')
+        try:
+            message.send()
+        except Exception as e:
+            record_failure(email, e)
+            failed += 1
+            if isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                continue  # The server answered and reset; the session is still good
+            # Otherwise the session may be gone; carry on with a fresh one
+            connection.close()
+            try:
+                connection.open()
+            except Exception:
+                pass  # send() tries again for the next message
+        else:
+            # Record it straight away so a lease running out later in the
+            # batch can't hand an already delivered message to another worker
+            OutgoingEmail.objects.filter(id=email.id).update(status='sent', sent_at=timezone.now(), claim='')
+            sent += 1
+
+    return sent, failed
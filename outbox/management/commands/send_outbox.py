@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from outbox.mail import claim_due_emails, send_emails
+
+
+class Command(BaseCommand):
+    help = 'Send queued emails in batches over one SMTP connection, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.EMAIL_OUTBOX_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds to wait before polling again when nothing is due')
+        parser.add_argument('--once', action='store_true',
+                            help='Send everything that is due, then exit (for cron)')
+
+    def handle(self, *args, **options):
+        connection = get_connection()
+        total_sent = total_failed = 0
+        try:
+            while True:
+                emails = claim_due_emails(options['batch_size'])
+                if emails:
+                    sent, failed = send_emails(emails, connection)
+                    total_sent += sent
+                    total_failed += failed
+                    self.stdout.write(f'Sent {sent} emails, {failed} failed')
+                    continue
+                if options['once']:
+                    break
+                # Don't hold the SMTP session open while idle
+                connection.close()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+
+        self.stdout.write(self.style.SUCCESS(f'Sent {total_sent} emails, {total_failed} failed'))
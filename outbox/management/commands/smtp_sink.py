@@ -0,0 +1,164 @@
+import random
+import socketserver
+import threading
+import time
+from email import policy
+from email.parser import BytesParser
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+MAX_MESSAGE_SIZE = 10 * 1024 * 1024
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    """
+    Just enough SMTP for Django's backend: EHLO/HELO, AUTH (any credentials),
+    MAIL, RCPT, DATA, RSET, NOOP and QUIT. No STARTTLS, so point the site at
+    it with EMAIL_USE_TLS=False.
+    """
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def read_line(self):
+        """The next line without its line ending, or None once the client has gone."""
+        line = self.rfile.readline(MAX_MESSAGE_SIZE)
+        return line.decode('utf-8', 'replace').rstrip('\r\n') if line else None
+
+    def handle(self):
+        sink = self.server.sink
+        sink.connection_opened(self.client_address)
+        self.reply('220 pethood-sink ESMTP')
+        sender, recipients = None, []
+
+        while True:
+            line = self.read_line()
+            if line is None:
+                return
+            command, _, argument = line.partition(' ')
+            command = command.upper()
+
+            if command == 'EHLO':
+                self.reply('250-pethood-sink')
+                self.reply('250-8BITMIME')
+                self.reply(f'250-SIZE {MAX_MESSAGE_SIZE}')
+                self.reply('250 AUTH PLAIN LOGIN')
+            elif command == 'HELO':
+                self.reply('250 pethood-sink')
+            elif command == 'AUTH':
+                mechanism, _, initial = argument.partition(' ')
+                if mechanism.upper() == 'LOGIN':
+                    self.reply('334 VXNlcm5hbWU6')
+                    self.read_line()
+                    self.reply('334 UGFzc3dvcmQ6')
+                    self.read_line()
+                elif not initial:
+                    self.reply('334 ')
+                    self.read_line()
+                self.reply('235 Authentication successful')
+            elif command == 'MAIL':
+                sender, recipients = self.address(argument), []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                recipients.append(self.address(argument))
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = self.read_data()
+                if data is None:
+                    return
+                self.reply(sink.deliver(sender, recipients, data))
+                sender, recipients = None, []
+            elif command == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif command == 'NOOP':
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+    @staticmethod
+    def address(argument):
+        # "FROM:<a@b.c> SIZE=123" -> "<a@b.c>"
+        return argument.partition(':')[2].strip().split(' ')[0]
+
+    def read_data(self):
+        lines = []
+        while True:
+            line = self.rfile.readline(MAX_MESSAGE_SIZE)
+            if not line:
+                return None
+            if line in (b'.\r\n', b'.\n'):
+                return b''.join(lines)
+            # Undo dot-stuffing
+            lines.append(line[1:] if line.startswith(b'.') else line)
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class Sink:
+
+    def __init__(self, command, outdir, fail_rate, delay):
+        self.command = command
+        self.outdir = Path(outdir) if outdir else None
+        self.fail_rate = fail_rate
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+
+    def connection_opened(self, address):
+        with self.lock:
+            self.connections += 1
+            number = self.connections
+        self.command.stdout.write(f'Connection {number} from {address[0]}:{address[1]}')
+
+    def deliver(self, sender, recipients, data):
+        if self.delay:
+            time.sleep(self.delay)
+        if random.random() < self.fail_rate:
+            return '451 Temporary failure, try again later'
+
+        with self.lock:
+            self.messages += 1
+            number = self.messages
+        message = BytesParser(policy=policy.default).parsebytes(data)
+        self.command.stdout.write(f"Message {number}: {sender} -> {', '.join(recipients)}: {message['subject']}")
+        if self.outdir:
+            (self.outdir / f'{number:06d}.eml').write_bytes(data)
+        return '250 OK queued'
+
+
+class Command(BaseCommand):
+    help = 'Run a local SMTP server that accepts and logs every message, for trying out the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=1025)
+        parser.add_argument('--outdir', help='Also save each message here as a .eml file')
+        parser.add_argument('--fail-rate', type=float, default=0,
+                            help='Fraction of messages to refuse with a temporary (451) error')
+        parser.add_argument('--delay', type=float, default=0,
+                            help='Seconds to wait before answering each message')
+
+    def handle(self, *args, **options):
+        if options['outdir']:
+            Path(options['outdir']).mkdir(parents=True, exist_ok=True)
+
+        server = SinkServer((options['host'], options['port']), SinkHandler)
+        server.sink = Sink(self, options['outdir'], options['fail_rate'], options['delay'])
+
+        self.stdout.write(self.style.SUCCESS(f"SMTP sink listening on {options['host']}:{options['port']}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,121 @@
+import smtplib
+from datetime import timedelta
+
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .mail import MAX_RETRY_DELAY, claim_due_emails, enqueue_email, retry_delay, send_emails
+from .models import OutgoingEmail
+
+
+class ScriptedBackend(BaseEmailBackend):
+    """Delivers each message, or raises the next scripted error for it."""
+
+    def __init__(self, errors=(), **kwargs):
+        super().__init__(**kwargs)
+        self.errors = list(errors)
+        self.sent = []
+
+    def send_messages(self, messages):
+        for message in messages:
+            error = self.errors.pop(0) if self.errors else None
+            if error:
+                raise error
+            self.sent.append(message)
+        return len(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    EMAIL_OUTBOX_MAX_ATTEMPTS=3,
+    EMAIL_OUTBOX_RETRY_DELAY=60,
+)
+class OutboxTests(TestCase):
+
+    def enqueue(self, count=1):
+        return [enqueue_email(f"Message {i}", 'Body', [f"user{i}@example.com"]) for i in range(count)]
+
+    def refreshed(self, email):
+        email.refresh_from_db()
+        return email
+
+    def test_claim_takes_due_messages_once(self):
+        first, second, later = self.enqueue(3)
+        OutgoingEmail.objects.filter(id=later.id).update(next_attempt_at=timezone.now() + timedelta(hours=1))
+
+        claimed = claim_due_emails(10)
+        self.assertEqual(claimed, [first, second])
+        self.assertTrue(all(email.status == 'sending' and email.claim for email in claimed))
+        # Claimed rows are leased, so a second worker finds nothing
+        self.assertEqual(claim_due_emails(10), [])
+
+    def test_claim_respects_batch_size(self):
+        self.enqueue(3)
+        self.assertEqual(len(claim_due_emails(2)), 2)
+        self.assertEqual(len(claim_due_emails(2)), 1)
+
+    def test_expired_lease_is_claimed_again(self):
+        email, = self.enqueue()
+        claim_due_emails(10)
+        OutgoingEmail.objects.filter(id=email.id).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(claim_due_emails(10), [email])
+
+    def test_send_delivers_and_marks_sent(self):
+        self.enqueue(2)
+        sent, failed = send_emails(claim_due_emails(10), get_connection())
+
+        self.assertEqual((sent, failed), (2, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(set(OutgoingEmail.objects.values_list('status', flat=True)), {'sent'})
+        self.assertFalse(OutgoingEmail.objects.filter(sent_at=None).exists())
+
+    def test_delivered_messages_are_marked_before_a_later_failure(self):
+        first, second = self.enqueue(2)
+        backend = ScriptedBackend([None, smtplib.SMTPServerDisconnected('gone')])
+        self.assertEqual(send_emails(claim_due_emails(10), backend), (1, 1))
+
+        self.assertEqual(self.refreshed(first).status, 'sent')
+        self.assertEqual(self.refreshed(second).status, 'pending')
+
+    def test_temporary_failure_is_retried_with_backoff(self):
+        email, = self.enqueue()
+        backend = ScriptedBackend([smtplib.SMTPResponseException(451, b'try later')])
+        before = timezone.now()
+        send_emails(claim_due_emails(10), backend)
+
+        email = self.refreshed(email)
+        self.assertEqual((email.status, email.attempts, email.claim), ('pending', 1, ''))
+        self.assertIn('451', email.last_error)
+        delay = email.next_attempt_at - before
+        self.assertTrue(timedelta(seconds=47) < delay < timedelta(seconds=73))
+        # Not due again until the backoff has passed
+        self.assertEqual(claim_due_emails(10), [])
+
+    def test_permanent_failure_is_not_retried(self):
+        email, = self.enqueue()
+        send_emails(claim_due_emails(10), ScriptedBackend([smtplib.SMTPResponseException(550, b'no such user')]))
+        self.assertEqual(self.refreshed(email).status, 'failed')
+
+    def test_gives_up_after_max_attempts(self):
+        email, = self.enqueue()
+        for _ in range(3):
+            OutgoingEmail.objects.filter(id=email.id).update(next_attempt_at=timezone.now())
+            send_emails(claim_due_emails(10), ScriptedBackend([smtplib.SMTPResponseException(451, b'busy')]))
+        email = self.refreshed(email)
+        self.assertEqual((email.status, email.attempts), ('failed', 3))
+
+    def test_retry_delay_doubles_up_to_the_cap(self):
+        for attempts, base in ((1, 60), (2, 120), (3, 240)):
+            delay = retry_delay(attempts).total_seconds()
+            self.assertTrue(base * 0.8 <= delay <= base * 1.2, (attempts, delay))
+        self.assertLessEqual(retry_delay(50), MAX_RETRY_DELAY * 1.2)
+
+    def test_enqueue_rolls_back_with_the_caller(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.enqueue()
+            raise RuntimeError
+        self.assertFalse(OutgoingEmail.objects.exists())
@@ -0,0 +1,284 @@
+"""
+Cart helpers shared by the views and the context processor.
+
+The header's cart count is kept in the session, so rendering a page costs
+no cart queries. The views that change the cart refresh it, which also
+stamps a new cart version that conditional GETs use in place of the cart's
+contents; a count left stale by another device's session is corrected the
+next time that session opens its cart.
+
+get_cart_summary() loads the lines being shown or checked out together with
+their products, and has the database work out each line total, the cart
+total and the line count in the same query.
+
+apply_cart_operations() applies a batch of edits from the cart page in one
+transaction, so several clicks cost one request and a handful of writes.
+
+add_cart_item() is the add-to-cart and buy-now click: one INSERT ... ON
+CONFLICT against the (cart, product, size) constraint, so concurrent clicks
+can't create duplicate lines.
+"""
+import time
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum, Window
+from django.utils import timezone
+
+from .models import Cart, CartItem, Product
+
+CART_COUNT_SESSION_KEY = 'cart_count'
+CART_VERSION_SESSION_KEY = 'cart_version'
+CENTS = Decimal('0.01')
+
+MAX_CART_OPERATIONS = 50
+MAX_ITEM_QUANTITY = 999
+
+
+def count_cart_items(user):
+    return CartItem.objects.filter(cart__user=user).count()
+
+
+def get_cart_count(request):
+    """The user's cart line count, from the session when it is there."""
+    if not request.user.is_authenticated:
+        return 0
+    count = request.session.get(CART_COUNT_SESSION_KEY)
+    if count is None:
+        count = refresh_cart_count(request)
+    return count
+
+
+def refresh_cart_count(request, count=None):
+    """
+    Store the current count (recounted unless given) in the session, with a
+    new cart version. Call it whenever the cart may have changed.
+    """
+    if count is None:
+        count = count_cart_items(request.user)
+    request.session[CART_COUNT_SESSION_KEY] = count
+    request.session[CART_VERSION_SESSION_KEY] = time.time_ns()
+    return count
+
+
+def get_cart_version(request):
+    """A token that changes whenever this session changes the cart."""
+    if not request.user.is_authenticated:
+        return 0
+    if CART_VERSION_SESSION_KEY not in request.session:
+        refresh_cart_count(request)
+    return request.session[CART_VERSION_SESSION_KEY]
+
+
+class CartSummary:
+
+    def __init__(self, items):
+        self.items = items
+        # SQLite drops trailing zeros from computed decimals
+        for item in items:
+            item.line_total = item.line_total.quantize(CENTS)
+        # Every row carries the window totals; an empty cart has none
+        self.total = items[0].cart_total.quantize(CENTS) if items else Decimal('0.00')
+        self.count = items[0].cart_count if items else 0
+
+    @property
+    def item_ids(self):
+        return [item.id for item in self.items]
+
+
+def line_total_expression():
+    """price * quantity for a CartItem row, computed by the database."""
+    return ExpressionWrapper(
+        F('product__price') * F('quantity'),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def get_cart_summary(user, item_id=None):
+    """
+    The user's cart lines (or just `item_id`, for buy now) with `product`
+    loaded and a `line_total` on each, plus the `total` and `count`.
+    """
+    line_total = line_total_expression()
+    items = CartItem.objects.filter(cart__user=user)
+    if item_id is not None:
+        items = items.filter(id=item_id)
+
+    items = items.select_related('product').annotate(
+        line_total=line_total,
+        cart_total=Window(Sum(line_total)),
+        cart_count=Window(Count('id')),
+    ).order_by('id')
+    return CartSummary(list(items))
+
+
+# ==================== ADD TO CART ====================
+
+def _upsert_sql(increment):
+    table = connection.ops.quote_name(CartItem._meta.db_table)
+    on_conflict = (
+        f"DO UPDATE SET quantity = {table}.quantity + 1, updated_at = excluded.updated_at"
+        if increment else 'DO NOTHING'
+    )
+    # The WHERE also keeps SQLite from reading ON CONFLICT as a join constraint
+    return (
+        f"INSERT INTO {table} (cart_id, product_id, size, quantity, updated_at) "
+        f"SELECT id, %s, %s, 1, %s FROM {connection.ops.quote_name(Cart._meta.db_table)} WHERE user_id = %s "
+        f"ON CONFLICT (cart_id, product_id, size) {on_conflict} "
+        f"RETURNING id, quantity"
+    )
+
+
+def add_cart_item(request, product, size='', increment=False):
+    """
+    Add one of `product` in `size` to the user's cart. A line that is
+    already there is left alone, or has its quantity bumped if `increment`.
+    Returns (item id, created); the id is None when nothing was written.
+    """
+    size = size or ''
+    count = get_cart_count(request)
+    params = [product.id, size, timezone.now(), request.user.id]
+
+    with connection.cursor() as cursor:
+        cursor.execute(_upsert_sql(increment), params)
+        row = cursor.fetchone()
+        if row is None and not Cart.objects.filter(user=request.user).exists():
+            # Carts are created lazily; make this one and try again
+            Cart.objects.get_or_create(user=request.user)
+            cursor.execute(_upsert_sql(increment), params)
+            row = cursor.fetchone()
+
+    if row is None:
+        return None, False
+    # New lines start at 1; a bumped line is at least 2
+    item_id, quantity = row
+    created = quantity == 1
+    refresh_cart_count(request, count + 1 if created else count)
+    return item_id, created
+
+
+# ==================== BATCHED EDITS ====================
+
+class CartOperationError(ValueError):
+    pass
+
+
+def _quantity(op, minimum):
+    try:
+        quantity = int(op.get('quantity', 1))
+    except (TypeError, ValueError):
+        raise CartOperationError(f"Invalid quantity: {op.get('quantity')}")
+    if not minimum <= quantity <= MAX_ITEM_QUANTITY:
+        raise CartOperationError(f"Quantity must be between {minimum} and {MAX_ITEM_QUANTITY}")
+    return quantity
+
+
+def _size(op):
+    size = op.get('size') or ''
+    if not isinstance(size, str) or len(size) > CartItem._meta.get_field('size').max_length:
+        raise CartOperationError(f"Invalid size: {size}")
+    return size
+
+
+def apply_cart_operations(user, operations):
+    """
+    Apply a list of edits to the user's cart, all or nothing:
+
+        {'op': 'add', 'product_id': 3, 'size': 'M', 'quantity': 1}
+        {'op': 'set_quantity', 'item_id': 7, 'quantity': 2}  (0 removes it)
+        {'op': 'set_size', 'item_id': 7, 'size': 'L'}
+        {'op': 'remove', 'item_id': 7}
+
+    Adding a product and size already in the cart, or moving a line onto
+    one, adds to that line's quantity. Raises CartOperationError.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise CartOperationError('No cart operations given')
+    if len(operations) > MAX_CART_OPERATIONS:
+        raise CartOperationError(f"At most {MAX_CART_OPERATIONS} operations per request")
+    if not all(isinstance(op, dict) for op in operations):
+        raise CartOperationError('Each operation must be an object')
+
+    product_ids = [op.get('product_id') for op in operations if op.get('op') == 'add']
+    if not all(isinstance(product_id, int) for product_id in product_ids):
+        raise CartOperationError('add needs a product_id')
+    products = Product.objects.in_bulk(product_ids)
+
+    with transaction.atomic():
+        # Lock the lines so concurrent batches apply one after the other
+        cart = Cart.objects.filter(user=user).first()
+        existing = CartItem.objects.select_for_update().filter(cart=cart) if cart else []
+        by_id = {item.id: item for item in existing}
+        original_sizes = {item.id: item.size for item in by_id.values()}
+        lines = {(item.product_id, item.size): item for item in by_id.values()}
+        # Unsaved lines can't be hashed, so changed lines are keyed by identity
+        changed, removed = {}, set()
+
+        def line_for(op):
+            item = by_id.get(op.get('item_id'))
+            if item is None or item.id in removed:
+                raise CartOperationError(f"Cart item not found: {op.get('item_id')}")
+            return item
+
+        def remove(item):
+            removed.add(item.id)
+            lines.pop((item.product_id, item.size), None)
+
+        for op in operations:
+            kind = op.get('op')
+            if kind == 'add':
+                product = products.get(op['product_id'])
+                if product is None:
+                    raise CartOperationError(f"Product not found: {op['product_id']}")
+                size, quantity = _size(op), _quantity(op, 1)
+                item = lines.get((product.id, size))
+                if item is None:
+                    if cart is None:
+                        cart = Cart.objects.create(user=user)
+                    item = lines[(product.id, size)] = CartItem(cart=cart, product=product, size=size, quantity=0)
+                item.quantity = min(item.quantity + quantity, MAX_ITEM_QUANTITY)
+                changed[id(item)] = item
+            elif kind == 'set_quantity':
+                item, quantity = line_for(op), _quantity(op, 0)
+                if quantity == 0:
+                    remove(item)
+                else:
+                    item.quantity = quantity
+                    changed[id(item)] = item
+            elif kind == 'set_size':
+                item, size = line_for(op), _size(op)
+                if size == item.size:
+                    continue
+                remove(item)
+                target = lines.get((item.product_id, size))
+                if target is None:
+                    # Same row, new size
+                    removed.discard(item.id)
+                    item.size = size
+                    lines[(item.product_id, size)] = item
+                    changed[id(item)] = item
+                else:
+                    target.quantity = min(target.quantity + item.quantity, MAX_ITEM_QUANTITY)
+                    changed[id(target)] = target
+            elif kind == 'remove':
+                # Already gone (say, from another tab) is fine
+                item = by_id.get(op.get('item_id'))
+                if item is not None:
+                    remove(item)
+            else:
+                raise CartOperationError(f"Unknown cart operation: {kind}")
+
+        now = timezone.now()
+        changed = [item for item in changed.values() if item.id not in removed]
+        for item in changed:
+            item.updated_at = now
+
+        # Lines that changed size are deleted and re-inserted under their own
+        # ids, so no write puts two lines on one (product, size) even briefly
+        moved = {item.id for item in changed if item.id and item.size != original_sizes[item.id]}
+        if removed or moved:
+            CartItem.objects.filter(id__in=removed | moved).delete()
+        CartItem.objects.bulk_update(
+            [item for item in changed if item.id and item.id not in moved], ['quantity', 'updated_at']
+        )
+        CartItem.objects.bulk_create([item for item in changed if not item.id or item.id in moved])
@@ -0,0 +1,54 @@
+import time
+
+from django.db.models import BigIntegerField, F, Value
+from django.db.models.functions import Greatest
+
+from .models import DatasetVersion
+
+# Datasets with a version token: 'catalog' (products), 'adoption' (dogs),
+# 'co_purchases' (the "frequently bought together" index) and the cached
+# personalized recommendations ('recommendations' for everybody's and
+# 'recommendations:<user id>' for one user's).
+# A token changes whenever anything in its dataset changes, so in-process
+# indexes and HTTP validators can tell they are stale without re-reading the
+# dataset. Tokens live in the database so a bump in one worker process is seen
+# by all of them; each process re-reads a token at most every
+# VERSION_CHECK_INTERVAL seconds, which bounds how stale it can be.
+
+VERSION_CHECK_INTERVAL = 1.0
+
+_checked = {}  # name -> (version, time.monotonic() when read)
+
+
+def get_versions(*names):
+    """Current version tokens, e.g. {'catalog': 1760000000000000000}."""
+    now = time.monotonic()
+    versions = {}
+    for name in names:
+        checked = _checked.get(name)
+        if checked and now - checked[1] < VERSION_CHECK_INTERVAL:
+            versions[name] = checked[0]
+
+    missing = [name for name in names if name not in versions]
+    if missing:
+        found = dict(DatasetVersion.objects.filter(name__in=missing).values_list('name', 'version'))
+        new = [name for name in missing if name not in found]
+        if new:
+            DatasetVersion.objects.bulk_create(
+                [DatasetVersion(name=name, version=time.time_ns()) for name in new],
+                ignore_conflicts=True,
+            )
+            found.update(DatasetVersion.objects.filter(name__in=new).values_list('name', 'version'))
+        for name in missing:
+            versions[name] = found[name]
+            _checked[name] = (found[name], now)
+    return versions
+
+
+def bump_version(name):
+    """Mark a dataset as changed."""
+    # Always move forward, even if this machine's clock is behind the last bump
+    now = Value(time.time_ns(), output_field=BigIntegerField())
+    if not DatasetVersion.objects.filter(name=name).update(version=Greatest(now, F('version') + 1)):
+        DatasetVersion.objects.bulk_create([DatasetVersion(name=name, version=now.value)], ignore_conflicts=True)
+    _checked.pop(name, None)
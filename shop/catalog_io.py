@@ -0,0 +1,342 @@
+"""
+Streaming catalog import and export.
+
+Catalogs are CSV, JSON Lines or a JSON array of objects with the columns in
+FIELDS. Files are read a row at a time and written in batches: one query
+allocates the slugs for the whole batch, and products and their size links go
+in with bulk_create. bulk_create sends no signals, so the size masks and the
+catalog version (which also marks the similarity index stale) are set here.
+
+A row whose slug matches an existing product updates it, so an export can be
+edited and imported back. Images are file names looked up in a local
+directory (copied into MEDIA_ROOT/products/) or products/ paths already in
+storage.
+"""
+import csv
+import io
+import json
+import posixpath
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils.text import slugify
+
+from .catalog import bump_version
+from .models import Product, Size, allocate_product_slugs
+from .sizes import names_from_mask, unmapped_size_links
+
+FIELDS = ['slug', 'name', 'category', 'price', 'description', 'image', 'sizes']
+FORMATS = ('csv', 'jsonl', 'json')
+SIZE_SEPARATOR = '|'
+
+BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 64 * 1024
+
+UPDATE_FIELDS = ['name', 'category', 'price', 'description', 'image', 'size_mask', 'updated_at']
+
+
+def detect_format(filename):
+    suffix = Path(filename).suffix.lower().lstrip('.')
+    if suffix == 'ndjson':
+        return 'jsonl'
+    return suffix if suffix in FORMATS else None
+
+
+# ==================== READING ====================
+
+def read_rows(stream, fmt):
+    """Yield one dict per product from a text stream."""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    elif fmt == 'jsonl':
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    elif fmt == 'json':
+        yield from _read_json_array(stream)
+    else:
+        raise ValueError(f"Unknown catalog format: {fmt}")
+
+
+def _read_json_array(stream):
+    """Decode a JSON array one element at a time, without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    finished = False
+
+    while not finished:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+
+        while True:
+            # Skip whitespace and separators up to the next element
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError('A JSON catalog must be an array of objects')
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                finished = True
+                break
+            try:
+                row, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise
+                break  # The element continues in the next chunk
+            position = end
+            yield row
+
+        if not chunk and not finished:
+            raise ValueError('Unexpected end of JSON catalog')
+
+
+# ==================== IMPORT ====================
+
+class ImportResult:
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.errors = []  # (row number, message)
+
+    def __str__(self):
+        return f"{self.created} created, {self.updated} updated, {len(self.errors)} rows skipped"
+
+
+class ImageStore:
+    """Copies images into storage once per file name."""
+
+    def __init__(self, images_dir=None):
+        self.images_dir = Path(images_dir).resolve() if images_dir else None
+        self.stored = {}
+
+    def resolve(self, value):
+        if value in self.stored:
+            return self.stored[value]
+
+        if self.images_dir:
+            source = (self.images_dir / value).resolve()
+            if source.is_relative_to(self.images_dir) and source.is_file():
+                name = f"products/{source.name}"
+                # Re-imports reuse the copy made last time
+                if not (default_storage.exists(name) and default_storage.size(name) == source.stat().st_size):
+                    with source.open('rb') as f:
+                        name = default_storage.save(name, File(f))
+                self.stored[value] = name
+                return name
+
+        # Otherwise it must name a product image already in storage
+        if posixpath.normpath(value) != value or not value.startswith('products/'):
+            raise ValueError(f"image not found: {value}")
+        try:
+            found = default_storage.exists(value)
+        except SuspiciousFileOperation:
+            raise ValueError(f"invalid image path: {value}")
+        if not found:
+            raise ValueError(f"image not found: {value}")
+        self.stored[value] = value
+        return value
+
+
+def _parse_row(row, categories):
+    """(fields, size names) for a row, or ValueError naming the problem."""
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise ValueError('name is required')
+
+    category = str(row.get('category') or '').strip().lower()
+    category = categories.get(category, category)
+    if category not in categories.values():
+        raise ValueError(f"unknown category: {row.get('category')}")
+
+    try:
+        price = Decimal(str(row.get('price')).strip())
+    except InvalidOperation:
+        raise ValueError(f"invalid price: {row.get('price')}")
+    if not price.is_finite() or not 0 <= price < 10 ** 8:
+        raise ValueError(f"invalid price: {row.get('price')}")
+    price = price.quantize(Decimal('0.01'))
+
+    sizes = row.get('sizes') or []
+    if isinstance(sizes, str):
+        sizes = sizes.replace(',', SIZE_SEPARATOR).split(SIZE_SEPARATOR)
+    sizes = [str(size).strip() for size in sizes if str(size).strip()]
+
+    fields = {
+        'slug': slugify(str(row.get('slug') or '')),
+        'name': name,
+        'category': category,
+        'price': price,
+        'description': str(row.get('description') or ''),
+        'image': str(row.get('image') or '').strip(),
+    }
+    return fields, sizes
+
+
+def import_products(rows, images_dir=None, batch_size=BATCH_SIZE):
+    """Create or update products from an iterable of row dicts."""
+    result = ImportResult()
+    images = ImageStore(images_dir)
+    sizes_by_name = {size.name: size for size in Size.objects.order_by('id')}
+
+    # Category values and labels are both accepted
+    categories = {}
+    for value, label in Product.CATEGORY_CHOICES:
+        categories[value] = value
+        categories[label.lower()] = value
+
+    batch = []
+    for number, row in enumerate(rows, 1):
+        try:
+            if not isinstance(row, dict):
+                raise ValueError('each row must be an object')
+            fields, sizes = _parse_row(row, categories)
+        except ValueError as e:
+            result.errors.append((number, str(e)))
+            continue
+        batch.append((number, fields, sizes))
+        if len(batch) >= batch_size:
+            _import_batch(batch, images, sizes_by_name, result)
+            batch = []
+    if batch:
+        _import_batch(batch, images, sizes_by_name, result)
+
+    if result.created or result.updated:
+        bump_version('catalog')
+    return result
+
+
+def _import_batch(batch, images, sizes_by_name, result):
+    existing = Product.objects.in_bulk(
+        [fields['slug'] for _, fields, _ in batch if fields['slug']], field_name='slug'
+    )
+    # A slug repeated within the batch is one product; the last row wins
+    last_rows = {fields['slug']: number for number, fields, _ in batch if fields['slug']}
+
+    # Unsaved products can't be hashed, so links are keyed by identity
+    to_create, to_update, links = [], [], {}
+    for number, fields, sizes in batch:
+        if fields['slug'] and last_rows[fields['slug']] != number:
+            result.errors.append((number, f"slug {fields['slug']} appears again in row {last_rows[fields['slug']]}"))
+            continue
+        product = existing.get(fields['slug'])
+        try:
+            image = images.resolve(fields['image']) if fields['image'] else None
+            if image is None and product is None:
+                raise ValueError('image is required for new products')
+            mask = 0
+            for size in sizes:
+                if size not in sizes_by_name:
+                    sizes_by_name[size] = Size.objects.create(name=size)
+                if sizes_by_name[size].bit is not None:
+                    mask |= 1 << sizes_by_name[size].bit
+        except ValueError as e:
+            result.errors.append((number, str(e)))
+            continue
+
+        if product is None:
+            product = Product(slug=fields['slug'])
+            to_create.append(product)
+        else:
+            to_update.append(product)
+        for field in ('name', 'category', 'price', 'description'):
+            setattr(product, field, fields[field])
+        if image:
+            product.image = image
+        product.size_mask = mask
+        links[id(product)] = (product, list(dict.fromkeys(sizes_by_name[size].id for size in sizes)))
+
+    # New products keep their own slug when it is free, else one from the name
+    slugs = allocate_product_slugs([product.slug or slugify(product.name) for product in to_create])
+    for product, slug in zip(to_create, slugs):
+        product.slug = slug
+
+    SizeLink = Product.sizes.through
+    with transaction.atomic():
+        Product.objects.bulk_create(to_create, batch_size=500)
+        _update_products(to_update)
+        SizeLink.objects.filter(product_id__in=[product.id for product in to_update]).delete()
+        SizeLink.objects.bulk_create([
+            SizeLink(product_id=product.id, size_id=size_id)
+            for product, product_size_ids in links.values()
+            for size_id in product_size_ids
+        ], batch_size=500)
+
+    result.created += len(to_create)
+    result.updated += len(to_update)
+
+
+def _update_products(products):
+    """
+    One parameterised UPDATE per product, run with executemany. bulk_update's
+    CASE expressions grow with the batch and would make large updates
+    quadratic; it would also skip the auto_now updated_at.
+    """
+    if not products:
+        return
+    # pre_save() stamps the auto_now updated_at
+    fields = [Product._meta.get_field(name) for name in UPDATE_FIELDS]
+    columns = ', '.join(f"{connection.ops.quote_name(field.column)} = %s" for field in fields)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {connection.ops.quote_name(Product._meta.db_table)} SET {columns} WHERE id = %s",
+            [
+                [field.get_db_prep_save(field.pre_save(product, False), connection) for field in fields] + [product.id]
+                for product in products
+            ],
+        )
+
+
+# ==================== EXPORT ====================
+
+def export_rows(chunk_size=2000):
+    """Yield every product as a row dict, in id order."""
+    unmapped = unmapped_size_links()
+    for product in Product.objects.order_by('id').iterator(chunk_size=chunk_size):
+        yield {
+            'slug': product.slug,
+            'name': product.name,
+            'category': product.category,
+            'price': str(product.price),
+            'description': product.description,
+            'image': product.image.name,
+            'sizes': SIZE_SEPARATOR.join(names_from_mask(product.size_mask, unmapped.get(product.id, ()))),
+        }
+
+
+def render_rows(rows, fmt):
+    """Yield the catalog file as text, a row at a time."""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    elif fmt == 'jsonl':
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + '\n'
+    elif fmt == 'json':
+        separator = '[\n'
+        for row in rows:
+            yield separator + json.dumps(row, ensure_ascii=False)
+            separator = ',\n'
+        yield '[]\n' if separator == '[\n' else '\n]\n'
+    else:
+        raise ValueError(f"Unknown catalog format: {fmt}")
@@ -0,0 +1,73 @@
+"""
+Conditional GET for catalog and adoption pages.
+
+A page is validated without running the view or rendering a template. Its
+strong ETag hashes the version tokens of the datasets it shows. It also
+hashes everything per-visitor that ends up in the HTML: the user, their
+cart (by the session's cart version, see shop/cart.py) and the CSRF cookie. Last-Modified comes from the same tokens and is
+only sent to anonymous visitors, whose pages carry no per-user state. Pages
+are never validated while flash messages are waiting to be shown.
+"""
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib import messages
+from django.views.decorators.http import condition
+
+from .cart import get_cart_version
+from .catalog import get_versions
+
+
+def ns_to_datetime(ns):
+    """A version token or st_mtime_ns as an aware datetime."""
+    return datetime.fromtimestamp(ns / 1e9, tz=dt_timezone.utc)
+
+
+def _visitor_parts(request):
+    user = request.user
+    parts = [
+        f"user={user.pk}:{int(user.is_staff)}" if user.is_authenticated else 'user=anonymous',
+        f"csrf={request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')}",
+    ]
+    if user.is_authenticated:
+        # Cart count in the header, and the in-cart state of product buttons
+        parts.append(f"cart={get_cart_version(request)}")
+    return parts
+
+
+def _page_state(request, datasets, extra, args, kwargs):
+    """(etag, last_modified) for the page, or (None, None) to skip validation."""
+    if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+        return None, None
+
+    versions = get_versions(*datasets)
+    parts = [f"{name}={versions[name]}" for name in datasets]
+    modified = [ns_to_datetime(token) for token in versions.values()]
+    if extra:
+        tag, last_modified = extra(request, *args, **kwargs)
+        parts.append(tag)
+        if last_modified:
+            modified.append(last_modified)
+    parts += _visitor_parts(request)
+
+    etag = hashlib.sha256('|'.join(parts).encode()).hexdigest()[:32]
+    last_modified = max(modified) if not request.user.is_authenticated else None
+    return etag, last_modified
+
+
+def conditional_page(*datasets, extra=None):
+    """
+    Answer repeat GETs with 304 Not Modified while `datasets` are unchanged.
+    `extra(request, *args, **kwargs)` may add a (tag, last_modified) pair
+    for anything else the page shows.
+    """
+    def state(request, *args, **kwargs):
+        if not hasattr(request, '_conditional_page_state'):
+            request._conditional_page_state = _page_state(request, datasets, extra, args, kwargs)
+        return request._conditional_page_state
+
+    return condition(
+        etag_func=lambda request, *args, **kwargs: state(request, *args, **kwargs)[0],
+        last_modified_func=lambda request, *args, **kwargs: state(request, *args, **kwargs)[1],
+    )
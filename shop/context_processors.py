@@ -1,9 +1,4 @@
-from .models import Cart
+from .cart import get_cart_count
 
 def cart_count(request):
-    if request.user.is_authenticated:
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        count = cart.items.count()
-    else:
-        count = 0
-    return {'cart_count': count}
\ No newline at end of file
+    return {'cart_count': get_cart_count(request)}
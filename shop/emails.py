@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from outbox.mail import enqueue_email
+
+
+def send_order_confirmation_email(order):
+    """Queue the HTML order confirmation email to the customer"""
+    # Load the items with their products once, for both versions
+    items = list(order.items.select_related('product'))
+
+    try:
+        subject = f'Order Confirmation - #{order.order_number}'
+        
+        # Get site URL
+        site_url = settings.SITE_URL if hasattr(settings, 'SITE_URL') else 'http://127.0.0.1:8000'
+        
+        # Render HTML email
+        html_content = render_to_string('emails/order_confirmation.html', {
+            'order': order,
+            'items': items,
+            'site_url': site_url,
+        })
+        
+        # Plain text fallback
+        text_content = f"""
+Dear {order.user.first_name},
+
+Thank you for your order!
+
+Order Details:
+Order Number: #{order.order_number}
+Order Date: {order.created_at.strftime('%B %d, %Y at %I:%M %p')}
+Total Amount: NPR {order.total_amount}
+
+Items Ordered:
+"""
+        for item in items:
+            text_content += f"\n- {item.product.name} x {item.quantity}"
+            if item.size:
+                text_content += f" (Size: {item.size})"
+            text_content += f" - NPR {item.subtotal}"
+        
+        text_content += f"""
+
+Shipping Address:
+{order.first_name} {order.last_name}
+{order.address}
+{order.city}
+
+We'll send you another email when your order ships.
+
+Thank you for shopping with Pethood!
+
+Best regards,
+The Pethood Team
+"""
+    except Exception as e:
+        print(f"Failed to render order confirmation email: {e}")
+        return False
+
+    # Sent by the send_outbox worker once the order has committed
+    enqueue_email(subject, text_content, [order.user.email], html_body=html_content)
+    return True
@@ -0,0 +1,91 @@
+"""
+Facet counts for the shop sidebar.
+
+Every facet is counted with all the other active filters applied but not its
+own, so each option shows how many products selecting it would leave
+(e.g. with "clothes" selected, "food" still shows its count). All counts come
+from one join-free aggregate of conditional COUNTs (sizes are read from
+Product.size_mask, see shop/sizes.py) and are cached per filter combination under the catalog
+version token, so any product change retires them.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .catalog import get_versions
+from .models import Product
+from .sizes import get_size_names, size_filter
+
+# (key, label, lower bound inclusive, upper bound exclusive)
+PRICE_BUCKETS = [
+    ('under-500', 'Under रु500', None, 500),
+    ('500-1000', 'रु500 – रु1000', 500, 1000),
+    ('1000-2500', 'रु1000 – रु2500', 1000, 2500),
+    ('2500-plus', 'रु2500 & above', 2500, None),
+]
+
+
+def price_bucket_filter(key):
+    for bucket_key, _, lower, upper in PRICE_BUCKETS:
+        if bucket_key == key:
+            q = Q()
+            if lower is not None:
+                q &= Q(price__gte=lower)
+            if upper is not None:
+                q &= Q(price__lt=upper)
+            return q
+    return Q()
+
+
+def product_filter(categories=(), size=None, price=None, ignore=None):
+    """The listing filters as a Q, leaving out the `ignore` facet."""
+    q = Q()
+    if categories and 'all' not in categories and ignore != 'category':
+        q &= Q(category__in=categories)
+    if size and ignore != 'size':
+        q &= size_filter(size)
+    if price and ignore != 'price':
+        q &= price_bucket_filter(price)
+    return q
+
+
+def _cache_key(categories, size, price):
+    state = json.dumps([sorted(categories), size or '', price or ''])
+    version = get_versions('catalog')['catalog']
+    return f"facets:{version}:{hashlib.md5(state.encode()).hexdigest()}"
+
+
+def get_facet_counts(categories=(), size=None, price=None):
+    """
+    {'category': {...}, 'size': {...}, 'price': {...}} option -> count
+    for the given filter state.
+    """
+    categories = list(categories)
+    key = _cache_key(categories, size, price)
+    counts = cache.get(key)
+    if counts is not None:
+        return counts
+
+    size_names = dict.fromkeys(get_size_names().values())
+    options = {
+        'category': [(value, Q(category=value)) for value, _ in Product.CATEGORY_CHOICES],
+        'size': [(name, size_filter(name)) for name in size_names],
+        'price': [(bucket_key, price_bucket_filter(bucket_key)) for bucket_key, _, _, _ in PRICE_BUCKETS],
+    }
+
+    aggregates = {}
+    for facet, facet_options in options.items():
+        others = product_filter(categories, size, price, ignore=facet)
+        for index, (_, q) in enumerate(facet_options):
+            aggregates[f"{facet}_{index}"] = Count('id', filter=others & q)
+    totals = Product.objects.aggregate(**aggregates)
+
+    counts = {
+        facet: {value: totals[f"{facet}_{index}"] for index, (value, _) in enumerate(facet_options)}
+        for facet, facet_options in options.items()
+    }
+    cache.set(key, counts, settings.FACET_CACHE_TIMEOUT)
+    return counts
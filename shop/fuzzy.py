@@ -0,0 +1,151 @@
+"""
+Typo-tolerant word correction backed by a character-trigram inverted index.
+
+Each dataset ('catalog': product names, descriptions and categories;
+'adoption': dog breeds and names) gets an in-process vocabulary with a
+trigram -> words posting list. An unknown query word is matched against the
+words sharing the most trigrams with it, and the best of those by edit
+distance replaces it. Like the typeahead index, the vocabularies are rebuilt
+lazily when the dataset's version token changes.
+"""
+import re
+import threading
+from collections import Counter
+
+from dog.models import Dog
+
+from .catalog import get_versions
+from .models import Product
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Candidates kept after trigram retrieval, before edit-distance re-ranking
+MAX_CANDIDATES = 20
+MIN_SIMILARITY = 0.3
+
+_indexes = {}
+_build_lock = threading.Lock()
+
+
+def words_of(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_distance(word):
+    """Edits allowed for a word of this length."""
+    if len(word) <= 4:
+        return 1
+    if len(word) <= 8:
+        return 2
+    return 3
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance, or limit + 1 once it is certain to exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class TrigramIndex:
+
+    def __init__(self, words):
+        self.words = sorted(set(words))
+        self.vocabulary = set(self.words)
+        self.word_trigrams = [trigrams(word) for word in self.words]
+        self.postings = {}
+        for position, grams in enumerate(self.word_trigrams):
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(position)
+
+    def correct(self, word):
+        """The closest known word, the word itself if known, or None."""
+        if word in self.vocabulary:
+            return word
+        if len(word) < 3 or word.isdigit():
+            return None
+
+        query_grams = trigrams(word)
+        overlap = Counter()
+        for gram in query_grams:
+            overlap.update(self.postings.get(gram, ()))
+
+        # Dice coefficient on trigram sets
+        candidates = []
+        for position, shared in overlap.items():
+            similarity = 2 * shared / (len(query_grams) + len(self.word_trigrams[position]))
+            if similarity >= MIN_SIMILARITY:
+                candidates.append((similarity, position))
+        candidates.sort(reverse=True)
+
+        limit = max_distance(word)
+        best = None
+        for similarity, position in candidates[:MAX_CANDIDATES]:
+            candidate = self.words[position]
+            distance = edit_distance(word, candidate, limit)
+            if distance <= limit and (best is None or (distance, -similarity) < best[0]):
+                best = ((distance, -similarity), candidate)
+        return best[1] if best else None
+
+
+def _catalog_words():
+    for name, description, category in Product.objects.values_list('name', 'description', 'category'):
+        yield from words_of(f"{name} {description} {category}")
+
+
+def _adoption_words():
+    for breed, name in Dog.objects.filter(is_approved=True).values_list('breed', 'name'):
+        yield from words_of(f"{breed} {name}")
+
+
+WORD_SOURCES = {
+    'catalog': _catalog_words,
+    'adoption': _adoption_words,
+}
+
+
+def get_index(dataset):
+    """The dataset's trigram index, rebuilt first if the dataset changed."""
+    version = get_versions(dataset)[dataset]
+    built = _indexes.get(dataset)
+    if built is None or built[0] != version:
+        with _build_lock:
+            built = _indexes.get(dataset)
+            if built is None or built[0] != version:
+                built = (version, TrigramIndex(WORD_SOURCES[dataset]()))
+                _indexes[dataset] = built
+    return built[1]
+
+
+def correct_words(text, dataset):
+    """{misspelt word: correction} for the words of `text` that are not known."""
+    index = get_index(dataset)
+    corrections = {}
+    for word in words_of(text):
+        correction = index.correct(word)
+        if correction and correction != word:
+            corrections[word] = correction
+    return corrections
+
+
+def correct_phrase(text, dataset):
+    """`text` lower-cased, with every misspelt word replaced by its correction."""
+    corrections = correct_words(text, dataset)
+    return ' '.join(corrections.get(word, word) for word in words_of(text))
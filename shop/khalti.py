@@ -0,0 +1,130 @@
+"""
+Khalti API client.
+
+Every call goes through one requests.Session per process, so connections to
+Khalti are pooled and kept alive instead of paying a TCP and TLS handshake per
+payment. Calls carry connect and read timeouts, so a slow gateway fails the
+request rather than holding a worker indefinitely.
+
+Only lookups are retried after a timeout or a 5xx reply, since asking for a
+payment's status twice is harmless. Initiate and verify are retried only when
+the connection could not be made, when nothing reached Khalti.
+
+Each call's latency is recorded per endpoint in this process; see
+latency_summary() and the khalti_loadtest command.
+"""
+import threading
+import time
+from collections import deque
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Latency samples kept per endpoint for the percentiles
+SAMPLE_SIZE = 2000
+LOOKUP_RETRY_STATUSES = (500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # Retry connection failures only; the request never left this machine
+                adapter = HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=settings.KHALTI_POOL_SIZE,
+                    max_retries=Retry(total=None, connect=2, read=0, status=0, other=0, backoff_factor=0.1),
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers['Authorization'] = f"Key {settings.KHALTI_SECRET_KEY}"
+                _session = session
+    return _session
+
+
+def _timeout():
+    return (settings.KHALTI_CONNECT_TIMEOUT, settings.KHALTI_READ_TIMEOUT)
+
+
+def _post(endpoint, url, retries=0, **kwargs):
+    """POST to Khalti and record how long it took. Raises requests.RequestException."""
+    started = time.perf_counter()
+    ok = False
+    try:
+        for attempt in range(retries + 1):
+            last_attempt = attempt == retries
+            try:
+                response = get_session().post(url, timeout=_timeout(), **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if last_attempt:
+                    raise
+            else:
+                if response.status_code not in LOOKUP_RETRY_STATUSES or last_attempt:
+                    ok = response.status_code < 500
+                    return response
+            time.sleep(0.2 * 2 ** attempt)
+    finally:
+        _record(endpoint, time.perf_counter() - started, ok)
+
+
+def initiate_payment(payload):
+    """Start an ePayment; the response carries the pidx and payment_url."""
+    return _post('initiate', settings.KHALTI_INITIATE_URL, json=payload)
+
+
+def lookup_payment(pidx):
+    """Status of an ePayment by pidx. Safe to repeat, so it is retried."""
+    return _post('lookup', settings.KHALTI_LOOKUP_URL, retries=settings.KHALTI_LOOKUP_RETRIES, json={'pidx': pidx})
+
+
+def verify_payment(token, amount):
+    """Verify a token from the Khalti checkout widget."""
+    return _post('verify', settings.KHALTI_VERIFY_URL, data={'token': token, 'amount': amount})
+
+
+# ==================== METRICS ====================
+
+def _record(endpoint, seconds, ok):
+    with _stats_lock:
+        stats = _stats.setdefault(endpoint, {'count': 0, 'errors': 0, 'samples': deque(maxlen=SAMPLE_SIZE)})
+        stats['count'] += 1
+        stats['errors'] += not ok
+        stats['samples'].append(seconds)
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def latency_summary():
+    """{endpoint: {'count', 'errors', 'p50', 'p95', 'p99', 'max'}} with times in ms."""
+    with _stats_lock:
+        snapshot = {endpoint: (stats['count'], stats['errors'], sorted(stats['samples']))
+                    for endpoint, stats in _stats.items()}
+
+    summary = {}
+    for endpoint, (count, errors, ordered) in snapshot.items():
+        summary[endpoint] = {
+            'count': count,
+            'errors': errors,
+            'p50': round(_percentile(ordered, 0.50) * 1000, 1),
+            'p95': round(_percentile(ordered, 0.95) * 1000, 1),
+            'p99': round(_percentile(ordered, 0.99) * 1000, 1),
+            'max': round(ordered[-1] * 1000, 1),
+        }
+    return summary
+
+
+def reset_latency_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from shop.recommendations import rebuild_product_sales
+
+
+class Command(BaseCommand):
+    help = 'Backfill the daily per-product sales buckets used for trending products'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=90,
+            help='How many days of order history to rebuild (default: 90)',
+        )
+
+    def handle(self, *args, **options):
+        buckets = rebuild_product_sales(days=options['days'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Sales buckets rebuilt for the last {options['days']} days: {buckets} buckets"
+        ))
@@ -0,0 +1,243 @@
+import itertools
+import random
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from shop import recommendations, similarity
+from shop.models import Order, OrderItem, Product, Size
+
+ADJECTIVES = ['cozy', 'classic', 'organic', 'floral', 'summer', 'winter', 'crunchy',
+              'soft', 'durable', 'premium', 'handmade', 'reflective', 'chewy', 'tasty']
+NOUNS = {
+    'food': ['kibble', 'treats', 'chews', 'biscuits', 'jerky', 'puppy food', 'dental sticks'],
+    'clothes': ['hoodie', 'tee', 'dress', 'raincoat', 'sweater', 'bandana', 'jacket'],
+    'accessories': ['collar', 'leash', 'harness', 'toy', 'bowl', 'bed', 'necklace'],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark shop/recommendations.py on a synthetic catalog and order history '
+        'in a throwaway SQLite database: p50/p95 latency, query counts and '
+        'hit-rate/precision@k against held-out orders'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=500)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--orders', type=int, default=2000, help='Orders to generate (including held-out ones)')
+        parser.add_argument('--items-per-order', type=int, default=3, help='Maximum order lines per order')
+        parser.add_argument('--runs', type=int, default=50, help='Timed calls per function')
+        parser.add_argument('--k', type=int, default=6, help='Recommendation list size for quality metrics')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as index_dir, override_settings(
+                SIMILARITY_INDEX_PATH=str(Path(index_dir) / 'product_neighbours.npy'),
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                    'LOCATION': 'bench-recommendations'}},
+            ):
+                self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        started = time.perf_counter()
+        held_out = self.generate(options)
+        self.stdout.write(
+            f"Generated {Product.objects.count()} products, {User.objects.count()} users, "
+            f"{Order.objects.count()} orders ({len(held_out)} held out) "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+
+        started = time.perf_counter()
+        recommendations.rebuild_co_purchases()
+        recommendations.rebuild_product_sales(days=90)
+        similarity.build_index()
+        self.stdout.write(f"Built indexes in {time.perf_counter() - started:.1f}s\n")
+
+        self.report_latency(options['runs'])
+        self.report_quality(held_out, options['k'])
+
+    # ==================== DATA ====================
+
+    def generate(self, options):
+        """Create the synthetic catalog and history; returns the held-out orders."""
+        rng = self.rng
+        categories = [choice for choice, _ in Product.CATEGORY_CHOICES]
+        sizes = Size.objects.bulk_create([Size(name=name) for name in ('S', 'M', 'L', 'XL')])
+
+        products = Product.objects.bulk_create([
+            Product(
+                name=f"{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS[category])} {i}",
+                slug=f"bench-product-{i}",
+                category=category,
+                price=Decimal(str(round(rng.lognormvariate(4, 1), 2))),
+                description=' '.join(rng.choices(ADJECTIVES + NOUNS[category], k=12)),
+                image='products/bench.jpg',
+            )
+            for i, category in enumerate(rng.choices(categories, k=options['products']))
+        ], batch_size=500)
+
+        SizeLink = Product.sizes.through
+        SizeLink.objects.bulk_create([
+            SizeLink(product_id=product.id, size_id=size.id)
+            for product in products if product.category != 'food'
+            for size in rng.sample(sizes, rng.randint(1, len(sizes)))
+        ], batch_size=500)
+
+        users = User.objects.bulk_create([
+            User(username=f"bench_user_{i}", email=f"bench_user_{i}@example.com")
+            for i in range(options['users'])
+        ], batch_size=500)
+
+        # Popularity follows a long tail, and every user leans towards a category
+        by_category = {category: [p for p in products if p.category == category] for category in categories}
+        weights = {category: [1 / (rank + 1) for rank in range(len(items))] for category, items in by_category.items()}
+        favourite = {user.id: rng.choice(categories) for user in users}
+
+        now = timezone.now()
+        planned = []
+        for i in range(options['orders']):
+            user = rng.choice(users)
+            lines = {}
+            for _ in range(rng.randint(1, options['items_per_order'])):
+                category = favourite[user.id] if rng.random() < 0.7 else rng.choice(categories)
+                if by_category[category]:
+                    product = rng.choices(by_category[category], weights[category])[0]
+                    lines[product.id] = product
+            planned.append((user, now - timedelta(minutes=rng.randint(0, 60 * 24 * 60)), list(lines.values())))
+
+        # Hold out each user's latest order when they have more than one
+        planned.sort(key=lambda order: order[1])
+        latest = {}
+        order_counts = {}
+        for index, (user, _, _) in enumerate(planned):
+            latest[user.id] = index
+            order_counts[user.id] = order_counts.get(user.id, 0) + 1
+        held_out_indexes = {index for user_id, index in latest.items() if order_counts[user_id] > 1}
+
+        training = [order for index, order in enumerate(planned) if index not in held_out_indexes]
+        held_out = [(user, items) for index, (user, _, items) in enumerate(planned) if index in held_out_indexes]
+
+        with transaction.atomic():
+            orders = Order.objects.bulk_create([
+                Order(
+                    user=user, order_number=f"ORD-BENCH{i}",
+                    first_name='Bench', last_name='User', email=user.email, phone='9800000000',
+                    address='Benchmark Street', city='Kathmandu',
+                    total_amount=sum(p.price for p in items), payment_method='cod',
+                )
+                for i, (user, _, items) in enumerate(training)
+            ], batch_size=500)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=rng.randint(1, 3), price=product.price)
+                for order, (_, _, items) in zip(orders, training)
+                for product in items
+            ], batch_size=500)
+
+            # auto_now_add ignores the planned dates on insert
+            for order, (_, created_at, _) in zip(orders, training):
+                Order.objects.filter(id=order.id).update(created_at=created_at)
+
+        return held_out
+
+    # ==================== LATENCY ====================
+
+    def report_latency(self, runs):
+        rng = self.rng
+        products = list(Product.objects.all())
+        users = list(User.objects.all())
+
+        # The warm case repeats calls on a fixed, primed sample of users; the
+        # cold case draws from everyone else so it can't evict them
+        warm_users = rng.sample(users, min(10, len(users)))
+        cold_users = [user for user in users if user not in warm_users] or users
+        for user in warm_users:
+            recommendations.get_personalized_recommendations(user, limit=6)
+        next_warm_user = itertools.cycle(warm_users).__next__
+
+        def personalized_cold(user):
+            recommendations.invalidate_user_recommendations(user.id)
+            return recommendations.get_personalized_recommendations(user, limit=6)
+
+        cases = [
+            ('get_similar_products', lambda: recommendations.get_similar_products(rng.choice(products), limit=4)),
+            ('get_frequently_bought_together', lambda: recommendations.get_frequently_bought_together(rng.choice(products), limit=3)),
+            ('get_trending_products', lambda: recommendations.get_trending_products(days=30, limit=8)),
+            ('get_personalized_recommendations (cold)', lambda: personalized_cold(rng.choice(cold_users))),
+            ('get_personalized_recommendations (warm)', lambda: recommendations.get_personalized_recommendations(next_warm_user(), limit=6)),
+            ('get_similar_products_bulk (x50)', lambda: recommendations.get_similar_products_bulk(rng.sample(products, min(50, len(products))))),
+            ('get_frequently_bought_together_bulk (x50)', lambda: recommendations.get_frequently_bought_together_bulk(rng.sample(products, min(50, len(products))))),
+            ('get_personalized_recommendations_bulk (x50)', lambda: recommendations.get_personalized_recommendations_bulk(rng.sample(users, min(50, len(users))))),
+        ]
+
+        self.stdout.write(f"{'function':<46} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8}")
+        for name, call in cases:
+            timings = []
+            queries = []
+            for _ in range(runs):
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    result = call()
+                    if not isinstance(result, (list, dict)):
+                        result = list(result)
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries.append(len(captured))
+            self.stdout.write(
+                f"{name:<46} {percentile(timings, 50):>9.2f} {percentile(timings, 95):>9.2f} "
+                f"{statistics.mean(queries):>8.1f}"
+            )
+        self.stdout.write('')
+
+    # ==================== QUALITY ====================
+
+    def report_quality(self, held_out, k):
+        scores = {
+            'get_personalized_recommendations': [],
+            'get_trending_products (baseline)': [],
+            'get_frequently_bought_together': [],
+            'get_similar_products': [],
+        }
+        trending = {p.id for p in recommendations.get_trending_products(limit=k)}
+
+        for user, items in held_out:
+            expected = {p.id for p in items}
+            recommended = {p.id for p in recommendations.get_personalized_recommendations(user, limit=k)}
+            scores['get_personalized_recommendations'].append(len(recommended & expected))
+            scores['get_trending_products (baseline)'].append(len(trending & expected))
+
+            # Seed item-to-item recommenders with the first line of the order
+            if len(items) > 1:
+                seed, rest = items[0], {p.id for p in items[1:]}
+                bought_together = {p.id for p in recommendations.get_frequently_bought_together(seed, limit=k)}
+                similar = {p.id for p in recommendations.get_similar_products(seed, limit=k)}
+                scores['get_frequently_bought_together'].append(len(bought_together & rest))
+                scores['get_similar_products'].append(len(similar & rest))
+
+        self.stdout.write(f"{'recommender':<46} {'orders':>8} {'hit rate':>9} {f'P@{k}':>9}")
+        for name, matches in scores.items():
+            if not matches:
+                continue
+            hit_rate = sum(1 for m in matches if m) / len(matches)
+            precision = sum(matches) / (len(matches) * k)
+            self.stdout.write(f"{name:<46} {len(matches):>8} {hit_rate:>9.3f} {precision:>9.3f}")
+
+
+def percentile(values, pct):
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method='inclusive')[pct - 1]
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from shop.similarity import build_index, index_path, watch_index
+
+
+class Command(BaseCommand):
+    help = 'Compute nearest neighbours for every product and write the similarity index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--neighbours', type=int, default=None,
+            help='Neighbours to keep per product (default: SIMILARITY_NEIGHBOURS)',
+        )
+        parser.add_argument('--watch', action='store_true',
+                            help='Keep running and rebuild whenever the catalog changes')
+        parser.add_argument('--interval', type=float, default=10,
+                            help='Seconds between staleness checks with --watch')
+        parser.add_argument('--debounce', type=float, default=30,
+                            help='Seconds the catalog must be unchanged before a rebuild with --watch')
+
+    def handle(self, *args, **options):
+        if options['watch']:
+            try:
+                watch_index(options['interval'], options['debounce'], on_build=self.report)
+            except KeyboardInterrupt:
+                pass
+            return
+
+        self.report(build_index(neighbours=options['neighbours']))
+
+    def report(self, count):
+        self.stdout.write(self.style.SUCCESS(f'Similarity index built for {count} products: {index_path()}'))
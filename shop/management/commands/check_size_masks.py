@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from shop.catalog import bump_version
+from shop.sizes import find_stale_size_masks, sync_size_masks
+
+
+class Command(BaseCommand):
+    help = 'Check Product.size_mask against the product sizes, optionally repairing it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rewrite the masks that are out of sync')
+
+    def handle(self, *args, **options):
+        stale = find_stale_size_masks()
+        if not stale:
+            self.stdout.write(self.style.SUCCESS('All product size masks are in sync'))
+            return
+
+        for product_id, stored, expected in stale:
+            self.stdout.write(f'Product {product_id}: size_mask is {stored:#b}, expected {expected:#b}')
+
+        if options['fix']:
+            fixed = sync_size_masks()
+            bump_version('catalog')
+            self.stdout.write(self.style.SUCCESS(f'Fixed {fixed} product size masks'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{len(stale)} product size masks are out of sync (run with --fix)'))
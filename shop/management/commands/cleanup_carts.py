@@ -0,0 +1,54 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from shop.models import Cart, CartItem
+
+# Empty carts younger than this may be about to receive their first item
+EMPTY_CART_GRACE = timedelta(hours=1)
+
+
+class Command(BaseCommand):
+    help = 'Delete cart items untouched for the retention window, then empty carts, in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CART_RETENTION_DAYS,
+                            help='Delete cart items not updated for this many days')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Seconds to sleep between batches so other writers get the lock')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be deleted')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        stale_items = CartItem.objects.filter(updated_at__lt=now - timedelta(days=options['days']))
+        empty_carts = Cart.objects.filter(items__isnull=True, created_at__lt=now - EMPTY_CART_GRACE)
+
+        if options['dry_run']:
+            self.stdout.write(
+                f'Would delete {stale_items.count()} stale cart items, '
+                f'then {empty_carts.count()} (or more) empty carts'
+            )
+            return
+
+        items = self.delete_in_batches(stale_items, options)
+        carts = self.delete_in_batches(empty_carts, options)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {items} stale cart items and {carts} empty carts'))
+
+    def delete_in_batches(self, queryset, options):
+        """Each batch is its own short transaction, re-checking the filter as it deletes."""
+        deleted = 0
+        while True:
+            ids = list(queryset.values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                return deleted
+            with transaction.atomic():
+                _, per_model = queryset.filter(id__in=ids).delete()
+            deleted += per_model.get(queryset.model._meta.label, 0)
+            if len(ids) < options['batch_size']:
+                return deleted
+            time.sleep(options['pause'])
@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.catalog_io import FORMATS, detect_format, export_rows, render_rows
+
+
+class Command(BaseCommand):
+    help = 'Export every product as a CSV, JSON Lines or JSON catalog file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-o', '--output', help='Output file (default: stdout)')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the output extension, else csv')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        fmt = options['format'] or (detect_format(output) if output else None) or 'csv'
+
+        count = 0
+
+        def counted(rows):
+            nonlocal count
+            for row in rows:
+                count += 1
+                yield row
+
+        try:
+            f = open(output, 'w', encoding='utf-8', newline='') if output else sys.stdout
+        except OSError as e:
+            raise CommandError(f'Could not write {output}: {e}')
+        try:
+            for text in render_rows(counted(export_rows()), fmt):
+                f.write(text)
+        finally:
+            if output:
+                f.close()
+
+        if output:
+            self.stdout.write(self.style.SUCCESS(f'Exported {count} products to {output}'))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.catalog_io import BATCH_SIZE, FORMATS, detect_format, import_products, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Import products from a CSV, JSON Lines or JSON catalog file, creating or updating by slug'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Catalog file')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--images', help='Directory the image column is relative to')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or detect_format(options['path'])
+        if fmt is None:
+            raise CommandError('Cannot tell the catalog format from the file name; pass --format')
+
+        started = time.perf_counter()
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as f:
+                result = import_products(read_rows(f, fmt), options['images'], options['batch_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not import {options["path"]}: {e}')
+
+        for number, message in result.errors:
+            self.stderr.write(f'Row {number}: {message}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {options["path"]}: {result} in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,75 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import khalti
+
+
+class Command(BaseCommand):
+    help = 'Drive the Khalti client against the configured gateway (normally khalti_stub) and report latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=200, help='Number of payments to run through')
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--flow', choices=['epayment', 'verify'], default='epayment',
+                            help='epayment: initiate, pay, then look up; verify: widget token verification')
+
+    def handle(self, *args, **options):
+        khalti.reset_latency_stats()
+        run = self.epayment if options['flow'] == 'epayment' else self.verify
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            outcomes = list(pool.map(self.safely(run), range(options['payments'])))
+        elapsed = time.perf_counter() - started
+
+        failures = [outcome for outcome in outcomes if outcome is not True]
+        for endpoint, stats in sorted(khalti.latency_summary().items()):
+            self.stdout.write(
+                f"{endpoint:<9} {stats['count']:>6} calls  {stats['errors']:>4} errors  "
+                f"p50 {stats['p50']}ms  p95 {stats['p95']}ms  p99 {stats['p99']}ms  max {stats['max']}ms"
+            )
+        if failures:
+            self.stdout.write(self.style.WARNING(f'{len(failures)} payments failed, e.g. {failures[0]}'))
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['payments'] - len(failures)} payments in {elapsed:.2f}s "
+            f"({options['payments'] / elapsed:.1f}/s)"
+        ))
+
+    @staticmethod
+    def safely(run):
+        def wrapper(number):
+            try:
+                return run(number)
+            except Exception as e:
+                return f'{type(e).__name__}: {e}'
+        return wrapper
+
+    def epayment(self, number):
+        response = khalti.initiate_payment({
+            'return_url': 'http://127.0.0.1:8000/khalti-callback/',
+            'website_url': 'http://127.0.0.1:8000/',
+            'amount': 1000 + number,
+            'purchase_order_id': f'LOADTEST-{number}',
+            'purchase_order_name': 'Load test',
+        })
+        if response.status_code != 200:
+            return f'initiate returned {response.status_code}'
+        data = response.json()
+
+        # Stand in for the customer paying on the gateway's page
+        if '/pay/' not in data['payment_url']:
+            raise CommandError('The epayment flow needs the khalti_stub gateway')
+        khalti.get_session().get(data['payment_url'], allow_redirects=False, timeout=5)
+
+        response = khalti.lookup_payment(data['pidx'])
+        if response.status_code != 200 or response.json().get('status') != 'Completed':
+            return f'lookup returned {response.status_code}'
+        return True
+
+    def verify(self, number):
+        response = khalti.verify_payment(f'loadtest-token-{number}', 1000 + number)
+        if response.status_code != 200 or not response.json().get('idx'):
+            return f'verify returned {response.status_code}'
+        return True
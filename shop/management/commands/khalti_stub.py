@@ -0,0 +1,173 @@
+import json
+import random
+import secrets
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class StubGateway:
+    """In-memory payments for the stub; pidx -> payment dict."""
+
+    def __init__(self, base_url, latency, error_rate):
+        self.base_url = base_url
+        self.latency = latency
+        self.error_rate = error_rate
+        self.payments = {}
+        self.lock = threading.Lock()
+
+    def initiate(self, body):
+        pidx = secrets.token_hex(11)
+        payment = {
+            'pidx': pidx,
+            'total_amount': body.get('amount'),
+            'purchase_order_id': body.get('purchase_order_id'),
+            'return_url': body.get('return_url'),
+            'status': 'Pending',
+            'transaction_id': None,
+        }
+        with self.lock:
+            self.payments[pidx] = payment
+        expires_at = timezone.now() + timedelta(minutes=30)
+        return 200, {
+            'pidx': pidx,
+            'payment_url': f"{self.base_url}/pay/{pidx}/",
+            'expires_at': expires_at.isoformat(),
+            'expires_in': 1800,
+        }
+
+    def pay(self, pidx):
+        """Complete the payment, as if the customer paid on Khalti's page."""
+        with self.lock:
+            payment = self.payments.get(pidx)
+            if payment is None:
+                return None
+            if payment['status'] == 'Pending':
+                payment['status'] = 'Completed'
+                payment['transaction_id'] = secrets.token_urlsafe(16)
+            return dict(payment)
+
+    def lookup(self, body):
+        with self.lock:
+            payment = self.payments.get(body.get('pidx'))
+            payment = dict(payment) if payment else None
+        if payment is None:
+            return 404, {'detail': 'Not found.', 'error_key': 'validation_error'}
+        return 200, {
+            'pidx': payment['pidx'],
+            'total_amount': payment['total_amount'],
+            'status': payment['status'],
+            'transaction_id': payment['transaction_id'],
+            'fee': 0,
+            'refunded': False,
+        }
+
+    def verify(self, body):
+        if not body.get('token') or not body.get('amount'):
+            return 400, {'detail': 'token and amount are required', 'error_key': 'validation_error'}
+        return 200, {
+            'idx': secrets.token_urlsafe(16),
+            'amount': int(body['amount']),
+            'state': {'name': 'Completed'},
+            'token': body['token'],
+        }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real gateway
+
+    ROUTES = {
+        '/api/v2/epayment/initiate/': 'initiate',
+        '/api/v2/epayment/lookup/': 'lookup',
+        '/api/v2/payment/verify/': 'verify',
+    }
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        raw = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode()
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            return json.loads(raw or '{}')
+        return {key: values[0] for key, values in parse_qs(raw).items()}
+
+    def do_POST(self):
+        gateway = self.server.gateway
+        route = self.ROUTES.get(urlparse(self.path).path)
+        if route is None:
+            return self.send_json(404, {'detail': 'Not found.'})
+
+        body = self.read_body()
+        if gateway.latency:
+            time.sleep(random.expovariate(1 / gateway.latency))
+        if not self.headers.get('Authorization', '').startswith('Key '):
+            return self.send_json(401, {'detail': 'Invalid token.', 'status_code': 401})
+        if random.random() < gateway.error_rate:
+            return self.send_json(503, {'detail': 'Service unavailable.'})
+        self.send_json(*getattr(gateway, route)(body))
+
+    def do_GET(self):
+        # /pay/<pidx>/ stands in for Khalti's payment page
+        parts = urlparse(self.path).path.strip('/').split('/')
+        payment = self.server.gateway.pay(parts[1]) if len(parts) == 2 and parts[0] == 'pay' else None
+        if payment is None:
+            return self.send_json(404, {'detail': 'Not found.'})
+
+        query = urlencode({
+            'pidx': payment['pidx'],
+            'status': payment['status'],
+            'transaction_id': payment['transaction_id'],
+            'amount': payment['total_amount'],
+            'purchase_order_id': payment['purchase_order_id'],
+        })
+        self.send_response(302)
+        self.send_header('Location', f"{payment['return_url']}?{query}")
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in for the Khalti initiate, lookup and verify APIs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--latency', type=float, default=0,
+                            help='Mean seconds of simulated gateway latency (exponentially distributed)')
+        parser.add_argument('--error-rate', type=float, default=0,
+                            help='Fraction of API calls to answer with 503')
+        parser.add_argument('--verbose', action='store_true', help='Log every request')
+
+    def handle(self, *args, **options):
+        base_url = f"http://{options['host']}:{options['port']}"
+        server = ThreadingHTTPServer((options['host'], options['port']), StubHandler)
+        server.daemon_threads = True
+        server.verbose = options['verbose']
+        server.gateway = StubGateway(base_url, options['latency'], options['error_rate'])
+
+        self.stdout.write(self.style.SUCCESS(f'Khalti stub listening on {base_url}'))
+        self.stdout.write(
+            f'Point the site at it with KHALTI_INITIATE_URL={base_url}/api/v2/epayment/initiate/ '
+            f'KHALTI_LOOKUP_URL={base_url}/api/v2/epayment/lookup/ '
+            f'KHALTI_VERIFY_URL={base_url}/api/v2/payment/verify/'
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from shop.recommendations import rebuild_co_purchases
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the "frequently bought together" co-purchase index from order history'
+
+    def handle(self, *args, **options):
+        pairs = rebuild_co_purchases()
+        self.stdout.write(self.style.SUCCESS(f'Co-purchase index rebuilt: {pairs} product pairs'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.search import ensure_search_index, fts_available, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the SQLite FTS5 product search index'
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            raise CommandError('The full-text search index is only available on SQLite')
+        ensure_search_index()
+        count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt: {count} products'))
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.10 on 2026-10-18 04:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_alter_order_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCoPurchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('other_product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='co_purchases', to='shop.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', '-count'], name='shop_copurchase_top_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'other_product'), name='unique_co_purchase_pair')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def create_product_fts(apps, schema_editor):
+    # FTS5 is SQLite only; other databases keep the icontains search.
+    # The sync triggers are (re)created after every migrate by
+    # shop.search.ensure_search_index, since SQLite table rebuilds drop them.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("""
+        CREATE VIRTUAL TABLE shop_product_fts USING fts5(
+            name, description, category,
+            content='shop_product', content_rowid='id',
+            tokenize='porter unicode61'
+        )
+    """)
+
+
+def drop_product_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for trigger in ('insert', 'delete', 'update'):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS shop_product_fts_{trigger}")
+    schema_editor.execute("DROP TABLE IF EXISTS shop_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_productsalesday'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_product_fts, drop_product_fts),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.10 on 2026-10-18 04:34
+
+from django.db import migrations, models
+
+# A signed 64-bit column holds bits 0-62
+SIZE_BITS = 63
+
+
+def fill_size_masks(apps, schema_editor):
+    """Give the first 63 sizes bit (id - 1); later sizes have none."""
+    Size = apps.get_model('shop', 'Size')
+    Product = apps.get_model('shop', 'Product')
+    SizeLink = Product.sizes.through
+
+    sizes = list(Size.objects.filter(id__lte=SIZE_BITS))
+    for size in sizes:
+        size.bit = size.id - 1
+    Size.objects.bulk_update(sizes, ['bit'], batch_size=500)
+
+    masks = {}
+    for product_id, bit in SizeLink.objects.filter(size__bit__isnull=False).values_list('product_id', 'size__bit'):
+        masks[product_id] = masks.get(product_id, 0) | (1 << bit)
+    Product.objects.bulk_update(
+        [Product(id=product_id, size_mask=mask) for product_id, mask in masks.items()],
+        ['size_mask'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='size_mask',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='size',
+            name='bit',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.RunPython(fill_size_masks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.10 on 2026-10-18 05:12
+
+from django.db import migrations, models
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    CartItem = apps.get_model('shop', 'CartItem')
+
+    # Fold rows for the same cart, product and size into the oldest one
+    lines = {}
+    for item in CartItem.objects.order_by('id'):
+        key = (item.cart_id, item.product_id, item.size or '')
+        line = lines.get(key)
+        if line is None:
+            item.size = item.size or ''
+            lines[key] = item
+            continue
+        line.quantity += item.quantity
+        line.updated_at = max(line.updated_at, item.updated_at)
+        item.delete()
+
+    CartItem.objects.bulk_update(list(lines.values()), ['quantity', 'size', 'updated_at'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_cartitem_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='cartitem',
+            name='size',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product', 'size'), name='shop_cartitem_unique_line'),
+        ),
+    ]
@@ -1,18 +1,61 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
 from django.utils.text import slugify
-import random
-import string
+import re
+
+from .order_numbers import new_order_number
 
 # Create your models here.
 
 
 class Size(models.Model):
     name = models.CharField(max_length=10)
+    # Position of this size in Product.size_mask; None once all are taken
+    bit = models.PositiveSmallIntegerField(null=True, blank=True, unique=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None or self.bit is not None:
+            return super().save(*args, **kwargs)
+
+        from .sizes import free_size_bit
+        self.bit = free_size_bit()
+        try:
+            with transaction.atomic():
+                return super().save(*args, **kwargs)
+        except IntegrityError:
+            if self.bit is None or not Size.objects.filter(bit=self.bit).exists():
+                raise
+            # Another size took the position first; this one uses the join
+            self.bit = None
+            return super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
+def allocate_product_slugs(base_slugs):
+    """
+    A free slug for each base ("tee", "tee-1", "tee-2", ...), reading every
+    slug already taken by any of the bases in one query.
+    """
+    alternatives = '|'.join(re.escape(base) for base in set(base_slugs))
+    taken = set(
+        Product.objects.filter(slug__regex=rf'^({alternatives})(-[0-9]+)?$').values_list('slug', flat=True)
+    )
+
+    slugs = []
+    next_counter = {}
+    for base in base_slugs:
+        slug = base
+        counter = next_counter.get(base, 1)
+        while slug in taken:
+            slug = f"{base}-{counter}"
+            counter += 1
+        next_counter[base] = counter
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
 class Product(models.Model):
     CATEGORY_CHOICES = [
         ('food', 'Food'),
@@ -27,18 +70,28 @@ class Product(models.Model):
     description = models.TextField()
     image = models.ImageField(upload_to='products/')
     sizes = models.ManyToManyField(Size, blank=True)   #  multiple sizes
+    # Bit Size.bit per size in `sizes`, kept in sync by shop/signals.py
+    size_mask = models.BigIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            base_slug = slugify(self.name)
-            slug = base_slug
-            counter = 1
-            while Product.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
+            self.slug = allocate_product_slugs([slugify(self.name)])[0]
         super().save(*args, **kwargs)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination under the price sorts, with and without a category filter
+            models.Index(fields=['price', 'id'], name='shop_product_price_id_idx'),
+            models.Index(fields=['category', 'price', 'id'], name='shop_product_cat_price_idx'),
+        ]
+
+    @property
+    def size_names(self):
+        """Names of the product's sizes, read from size_mask without a join."""
+        from .sizes import names_from_mask, unmapped_size_links
+        return names_from_mask(self.size_mask, unmapped_size_links([self.id]).get(self.id, ()))
+
     def __str__(self):
         return self.name
     
@@ -57,7 +110,17 @@ class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name="items", on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
-    size = models.CharField(max_length=10, blank=True, null=True)  
+    # '' rather than NULL for no size, so the unique constraint covers it
+    size = models.CharField(max_length=10, blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='shop_cartitem_updated_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product', 'size'], name='shop_cartitem_unique_line'),
+        ]
 
     def subtotal(self):
         return self.product.price * self.quantity
@@ -107,21 +170,24 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    ORDER_NUMBER_ATTEMPTS = 3
+
     def save(self, *args, **kwargs):
-        if not self.order_number:
-            self.order_number = self.generate_order_number()
-        super().save(*args, **kwargs)
+        if self.order_number:
+            return super().save(*args, **kwargs)
 
-    @staticmethod
-    def generate_order_number():
-        """Generate a unique random order number like ORD-ABC123XYZ"""
-        while True:
-            # Generate random alphanumeric string
-            random_str = ''.join(random.choices(string.ascii_uppercase + string.digits, k=9))
-            order_number = f"ORD-{random_str}"
-            # Check if this order number already exists
-            if not Order.objects.filter(order_number=order_number).exists():
-                return order_number
+        # Numbers are generated without a lookup; on the rare clash with an
+        # existing one, roll back to the savepoint and try a fresh number.
+        # Any other integrity error is the caller's to handle.
+        for attempt in range(self.ORDER_NUMBER_ATTEMPTS):
+            self.order_number = new_order_number()
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                clash = Order.objects.filter(order_number=self.order_number).exists()
+                if not clash or attempt == self.ORDER_NUMBER_ATTEMPTS - 1:
+                    raise
 
     def __str__(self):
         return f"Order {self.order_number} - {self.user.username}"
@@ -145,4 +211,47 @@ class OrderItem(models.Model):
         return f"{self.product.name} x {self.quantity}"
 
 
+class ProductCoPurchase(models.Model):
+    """How many orders contained both `product` and `other_product`."""
+    product = models.ForeignKey(Product, related_name='co_purchases', on_delete=models.CASCADE)
+    other_product = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'other_product'], name='unique_co_purchase_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['product', '-count'], name='shop_copurchase_top_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} + {self.other_product_id} ({self.count})"
+
+
+class ProductSalesDay(models.Model):
+    """Per-product, per-day sales counters used for trending products."""
+    product = models.ForeignKey(Product, related_name='sales_days', on_delete=models.CASCADE)
+    day = models.DateField()
+    orders = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='unique_product_sales_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='shop_salesday_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.day}: {self.orders} orders, {self.quantity} items"
+
+
+class DatasetVersion(models.Model):
+    """Version token of a dataset (see shop/catalog.py), shared by every process."""
+    name = models.CharField(max_length=32, primary_key=True)
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.name}: {self.version}"
@@ -0,0 +1,62 @@
+"""
+Order placement.
+
+COD checkout and both Khalti confirmations turn the checked-out cart lines
+into an order through place_order(). It runs in one transaction with a fixed
+number of queries however many lines there are: the lines are locked and
+read with their prices in one query (the items and the total both come from
+it), the order items go in with one bulk insert and the lines are deleted
+in one statement. The confirmation email is queued in the same transaction,
+and the recommendation indexes are updated once the order has committed.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from .cart import CENTS, get_cart_count, refresh_cart_count
+from .emails import send_order_confirmation_email
+from .models import CartItem, Order, OrderItem
+from .recommendations import record_order_placed
+
+SHIPPING_CHARGE = Decimal('5.00')
+
+
+def place_order(request, item_id=None, shipping=SHIPPING_CHARGE, confirmation_email=False, **order_fields):
+    """
+    Create an order from the user's cart (or only the `item_id` line, for
+    buy now) with the given Order fields, and clear those lines. Returns the
+    order, or None if there was nothing to check out.
+    """
+    lines = CartItem.objects.filter(cart__user=request.user)
+    if item_id is not None:
+        lines = lines.filter(id=item_id)
+    count = get_cart_count(request)
+
+    with transaction.atomic():
+        # Lock the lines so a second submit waits and then finds them gone
+        locked = list(
+            lines.select_for_update(of=('self',)).order_by('id')
+            .values_list('id', 'product_id', 'quantity', 'size', 'product__price')
+        )
+        if not locked:
+            return None
+        line_ids = [line[0] for line in locked]
+
+        # From the rows read above, so a concurrent price edit can't split them
+        total = sum(price * quantity for _, _, quantity, _, price in locked)
+        order = Order.objects.create(
+            user=request.user,
+            total_amount=(total + shipping).quantize(CENTS),
+            **order_fields,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=product_id, quantity=quantity, size=size, price=price)
+            for _, product_id, quantity, size, price in locked
+        ])
+        CartItem.objects.filter(id__in=line_ids).delete()
+        if confirmation_email:
+            send_order_confirmation_email(order)
+        transaction.on_commit(lambda: record_order_placed(order))
+
+    refresh_cart_count(request, max(count - len(locked), 0))
+    return order
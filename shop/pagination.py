@@ -0,0 +1,76 @@
+"""
+Keyset (cursor) pagination for product listings.
+
+A page is fetched with "rows after the last one shown" instead of OFFSET, so
+page 50 costs the same as page 1 and rows do not shift when products are
+added. The cursor is the sort key of the last row, (price, id) for the price
+sorts and id otherwise, encoded as an opaque URL-safe token.
+"""
+import base64
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+
+# Sort option -> ordering; id breaks ties so the key is unique
+ORDERINGS = {
+    'price_low': ('price', 'id'),
+    'price_high': ('-price', '-id'),
+}
+DEFAULT_ORDERING = ('id',)
+
+
+def get_ordering(sort):
+    return ORDERINGS.get(sort, DEFAULT_ORDERING)
+
+
+def encode_cursor(product, sort):
+    if sort in ORDERINGS:
+        key = [str(product.price), product.id]
+    else:
+        key = [product.id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """The sort key in `cursor`, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if sort in ORDERINGS:
+            price, product_id = key
+            return Decimal(price), int(product_id)
+        product_id, = key
+        return (int(product_id),)
+    except (ValueError, TypeError, InvalidOperation):
+        return None
+
+
+def after_cursor(key, sort):
+    """Filter for the rows that come after `key` in the given sort."""
+    if sort == 'price_low':
+        price, product_id = key
+        return Q(price__gt=price) | Q(price=price, id__gt=product_id)
+    if sort == 'price_high':
+        price, product_id = key
+        return Q(price__lt=price) | Q(price=price, id__lt=product_id)
+    return Q(id__gt=key[0])
+
+
+def keyset_page(queryset, sort, cursor=None, per_page=12):
+    """
+    One page of `queryset` in the given sort, starting after `cursor`.
+    Returns (products, next_cursor); next_cursor is None on the last page.
+    """
+    queryset = queryset.order_by(*get_ordering(sort))
+    key = decode_cursor(cursor, sort)
+    if key is not None:
+        queryset = queryset.filter(after_cursor(key, sort))
+
+    # One extra row tells us whether there is a next page
+    products = list(queryset[:per_page + 1])
+    if len(products) > per_page:
+        products = products[:per_page]
+        return products, encode_cursor(products[-1], sort)
+    return products, None
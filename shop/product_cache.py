@@ -0,0 +1,56 @@
+"""
+Cached product detail bundles.
+
+What productdetails shows that is the same for every visitor and expensive
+to work out is which products to recommend: the similar and frequently-
+bought-together product ids. Those ids are cached per product under the
+similarity index version; the products themselves, and the product's sizes,
+are read fresh on every request, so renames, size changes and deleted
+products show up at once in every process. Recording an order deletes the
+bundles of the products in it (see forget_product_bundles); other processes
+pick up the new co-purchase ranking within PRODUCT_CACHE_TIMEOUT.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Product
+from .recommendations import get_frequently_bought_together, get_similar_products
+from .similarity import index_version
+
+
+def _bundle_key(product_id):
+    return f"product:{product_id}:{index_version()}"
+
+
+def get_product_bundle(slug):
+    """
+    {'product', 'sizes', 'similar_products', 'frequently_bought'} for the
+    product with this slug, or None if there is no such product.
+    """
+    product = Product.objects.filter(slug=slug).first()
+    if product is None:
+        return None
+
+    key = _bundle_key(product.id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = {
+            'similar_products': [p.id for p in get_similar_products(product, limit=4)],
+            'frequently_bought': [p.id for p in get_frequently_bought_together(product, limit=3)],
+        }
+        cache.set(key, ids, settings.PRODUCT_CACHE_TIMEOUT)
+
+    # One query for both lists; products deleted since are left out
+    products = Product.objects.in_bulk(set(ids['similar_products'] + ids['frequently_bought']))
+    return {
+        'product': product,
+        'sizes': product.size_names,
+        **{name: [products[pid] for pid in pids if pid in products] for name, pids in ids.items()},
+    }
+
+
+def forget_product_bundles(product_ids=None):
+    """Delete the cached bundles of these products (all products if None)."""
+    if product_ids is None:
+        product_ids = Product.objects.values_list('id', flat=True)
+    cache.delete_many([_bundle_key(product_id) for product_id in product_ids])
@@ -1,17 +1,50 @@
-from django.db.models import Count, Q, F
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import (
+    Case, Count, ExpressionWrapper, F, FloatField, Q, Sum, Value, When, Window
+)
+from django.db.models.functions import RowNumber, TruncDate
 from datetime import timedelta
 from django.utils import timezone
 from decimal import Decimal
-from .models import Product, Order, OrderItem
+from .catalog import bump_version, get_versions
+from .models import Product, OrderItem, ProductCoPurchase, ProductSalesDay
+from .similarity import get_neighbour_ids
+
+# Cached personalized recommendations are validated against two version
+# tokens (see shop/catalog.py): one for everybody's and one for the user's,
+# so an invalidation in one worker process reaches all of them.
+RECOMMENDATIONS_VERSION = 'recommendations'
+
+
+def _user_version_name(user_id):
+    return f'{RECOMMENDATIONS_VERSION}:{user_id}'
+
+
+def _generations(user_ids):
+    """{user id: the generation their cached entry must carry}."""
+    names = [_user_version_name(user_id) for user_id in user_ids]
+    versions = get_versions(RECOMMENDATIONS_VERSION, *names)
+    return {
+        user_id: (versions[RECOMMENDATIONS_VERSION], versions[name])
+        for user_id, name in zip(user_ids, names)
+    }
 
 
 def get_similar_products(product, limit=4):
     """
     Content-based recommendation: Find similar products based on category, price range.
+    Uses the precomputed similarity index when the product is in it.
     """
     if not product:
         return Product.objects.none()
     
+    neighbour_ids = get_neighbour_ids(product.id, limit)
+    if neighbour_ids is not None:
+        products_dict = Product.objects.in_bulk(neighbour_ids)
+        return [products_dict[pid] for pid in neighbour_ids if pid in products_dict]
+    
     # Calculate price range (±20%)
     price_min = product.price * Decimal('0.8')
     price_max = product.price * Decimal('1.2')
@@ -39,91 +72,144 @@ def get_similar_products(product, limit=4):
 def get_frequently_bought_together(product, limit=3):
     """
     Collaborative filtering: Find products frequently bought with this product.
+    Reads the precomputed co-purchase index (see record_co_purchases).
     """
     if not product:
         return Product.objects.none()
     
-    # Find orders containing this product
-    orders_with_product = Order.objects.filter(
-        items__product=product
-    ).values_list('id', flat=True)
+    # Top-k read from the co-purchase index
+    co_purchases = ProductCoPurchase.objects.filter(
+        product=product
+    ).select_related('other_product').order_by('-count')[:limit]
+    
+    frequently_bought = [co.other_product for co in co_purchases]
     
-    if not orders_with_product:
+    if not frequently_bought:
         # Fallback to similar products if no order history
         return get_similar_products(product, limit)
     
-    # Find other products in those orders using OrderItem
-    product_ids = OrderItem.objects.filter(
-        order_id__in=orders_with_product
-    ).exclude(
-        product=product
-    ).values('product').annotate(
-        purchase_count=Count('product')
-    ).order_by('-purchase_count')[:limit].values_list('product', flat=True)
+    return frequently_bought
+
+
+def record_co_purchases(order):
+    """
+    Add every product pair in an order to the co-purchase index.
+    Call this once the order's items have been written.
+    """
+    product_ids = set(order.items.values_list('product_id', flat=True))
+    if len(product_ids) < 2:
+        return
     
-    # Get the actual Product objects maintaining the order
-    products_dict = {p.id: p for p in Product.objects.filter(id__in=product_ids)}
-    frequently_bought = [products_dict[pid] for pid in product_ids if pid in products_dict]
+    with transaction.atomic():
+        # Make sure every pair has a row, then bump them all in one statement
+        ProductCoPurchase.objects.bulk_create([
+            ProductCoPurchase(product_id=a, other_product_id=b)
+            for a in product_ids for b in product_ids if a != b
+        ], ignore_conflicts=True)
+        
+        ProductCoPurchase.objects.filter(
+            product_id__in=product_ids,
+            other_product_id__in=product_ids
+        ).exclude(
+            product_id=F('other_product_id')
+        ).update(count=F('count') + 1)
+    bump_version('co_purchases')
     
-    return frequently_bought
+    # Only these products' "frequently bought together" lists changed
+    from .product_cache import forget_product_bundles
+    forget_product_bundles(product_ids)
+
+
+def rebuild_co_purchases():
+    """
+    Rebuild the whole co-purchase index from order history.
+    Returns the number of product pairs written.
+    """
+    co_purchase_table = ProductCoPurchase._meta.db_table
+    order_item_table = OrderItem._meta.db_table
+    
+    with transaction.atomic():
+        ProductCoPurchase.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {co_purchase_table} (product_id, other_product_id, count)
+                SELECT a.product_id, b.product_id, COUNT(DISTINCT a.order_id)
+                FROM {order_item_table} a
+                JOIN {order_item_table} b
+                  ON a.order_id = b.order_id AND a.product_id <> b.product_id
+                GROUP BY a.product_id, b.product_id
+            """)
+    bump_version('co_purchases')
+    
+    from .product_cache import forget_product_bundles
+    forget_product_bundles()
+    
+    return ProductCoPurchase.objects.count()
 
 
 def get_personalized_recommendations(user, limit=6):
     """
     Personalized recommendations based on user's purchase history.
+    Results are cached per user as a list of product ids.
     """
     if not user or not user.is_authenticated:
         return get_trending_products(limit=limit)
     
-    # Get user's past purchases (last 90 days)
-    ninety_days_ago = timezone.now() - timedelta(days=90)
-    user_orders = Order.objects.filter(
-        user=user,
-        created_at__gte=ninety_days_ago
-    )
+    cache_key = f'recs:personalized:user:{user.id}'
+    generation = _generations([user.id])[user.id]
+    entry = cache.get(cache_key)
+    
+    # Entries from an older generation are stale
+    if not entry or entry['generation'] != generation:
+        entry = {'generation': generation, 'limits': {}}
+    
+    product_ids = entry['limits'].get(limit)
+    if product_ids is not None:
+        _count_cache_lookup('hits')
+        products_dict = Product.objects.in_bulk(product_ids)
+        return [products_dict[pid] for pid in product_ids if pid in products_dict]
     
-    # Get categories the user has purchased from
+    _count_cache_lookup('misses')
+    recommendations = _compute_personalized_recommendations(user, limit)
+    entry['limits'][limit] = [product.id for product in recommendations]
+    cache.set(cache_key, entry, settings.RECOMMENDATION_CACHE_TIMEOUT)
+    return recommendations
+
+
+def _compute_personalized_recommendations(user, limit):
+    # Categories the user has purchased from (last 90 days)
+    ninety_days_ago = timezone.now() - timedelta(days=90)
     purchased_categories = OrderItem.objects.filter(
-        order__in=user_orders
-    ).values_list('product__category', flat=True).distinct()
+        order__user=user,
+        order__created_at__gte=ninety_days_ago
+    ).values('product__category')
     
-    # Get product IDs user already purchased
+    # Product IDs user already purchased
     purchased_product_ids = OrderItem.objects.filter(
         order__user=user
-    ).values_list('product_id', flat=True).distinct()
-    
-    if not purchased_categories:
-        # New user - show trending products
-        return get_trending_products(limit=limit)
-    
-    # Find products in those categories that user hasn't purchased
-    # Use direct OrderItem query instead of reverse relation
-    product_order_counts = OrderItem.objects.filter(
-        product__category__in=purchased_categories
-    ).exclude(
-        product_id__in=purchased_product_ids
-    ).values('product').annotate(
-        order_count=Count('order', distinct=True)
-    ).order_by('-order_count')
+    ).values('product_id')
     
-    # Get product IDs in order of popularity
-    product_ids = [item['product'] for item in product_order_counts]
-    
-    # Get actual Product objects
-    products_dict = {p.id: p for p in Product.objects.filter(id__in=product_ids)}
-    recommended = [products_dict[pid] for pid in product_ids if pid in products_dict]
-    
-    # Diversify - max 2 products per category
-    diverse_recommendations = []
-    category_count = {}
-    
-    for product in recommended:
-        if category_count.get(product.category, 0) < 2:
-            diverse_recommendations.append(product)
-            category_count[product.category] = category_count.get(product.category, 0) + 1
-        
-        if len(diverse_recommendations) >= limit:
-            break
+    # Rank unpurchased products in those categories by popularity and keep
+    # at most 2 per category, all inside the database
+    diverse_recommendations = list(
+        Product.objects.filter(
+            category__in=purchased_categories
+        ).exclude(
+            id__in=purchased_product_ids
+        ).annotate(
+            order_count=Count('orderitem__order', distinct=True)
+        ).filter(
+            order_count__gt=0
+        ).annotate(
+            category_rank=Window(
+                RowNumber(),
+                partition_by=F('category'),
+                order_by=[F('order_count').desc(), F('id').asc()]
+            )
+        ).filter(
+            category_rank__lte=2
+        ).order_by('-order_count', 'id')[:limit]
+    )
     
     # If not enough, fill with trending
     if len(diverse_recommendations) < limit:
@@ -135,20 +221,68 @@ def get_personalized_recommendations(user, limit=6):
     return diverse_recommendations[:limit]
 
 
-def get_trending_products(days=30, limit=8):
+def _count_cache_lookup(outcome):
+    key = f'recs:personalized:{outcome}'
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, None)
+
+
+def invalidate_user_recommendations(user_id):
+    """Retire a user's cached personalized recommendations in every process."""
+    bump_version(_user_version_name(user_id))
+
+
+def invalidate_all_recommendations():
+    """Retire every user's cached personalized recommendations in every process."""
+    bump_version(RECOMMENDATIONS_VERSION)
+
+
+def get_recommendation_cache_stats():
+    """
+    Hit/miss counters for the personalized recommendation cache. They live
+    in the cache, so with a per-process backend they cover this process only.
+    """
+    hits = cache.get('recs:personalized:hits', 0)
+    misses = cache.get('recs:personalized:misses', 0)
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits * 100 / lookups, 1) if lookups else 0,
+    }
+
+
+def get_trending_products(days=30, limit=8, half_life=None):
     """
     Get trending/popular products based on recent orders.
+    Sums the daily sales buckets of the last `days` days; pass `half_life`
+    (in days) to weight recent days more heavily.
     """
-    cutoff_date = timezone.now() - timedelta(days=days)
+    today = timezone.localdate()
+    start_day = today - timedelta(days=days)
     
-    # Use OrderItem to get trending products
-    trending_data = OrderItem.objects.filter(
-        order__created_at__gte=cutoff_date
+    # Score each day's bucket, optionally decayed by its age
+    bucket_score = F('orders') * 1.5 + F('quantity')
+    if half_life:
+        weight = Case(
+            *[
+                When(day=today - timedelta(days=age), then=Value(0.5 ** (age / half_life)))
+                for age in range(days + 1)
+            ],
+            default=Value(0.0),
+        )
+        bucket_score = bucket_score * weight
+    
+    trending_data = ProductSalesDay.objects.filter(
+        day__gte=start_day
     ).values('product').annotate(
-        order_count=Count('order', distinct=True),
-        total_quantity=Count('id')
-    ).annotate(
-        popularity_score=F('order_count') * Decimal('1.5') + F('total_quantity')
+        popularity_score=Sum(ExpressionWrapper(bucket_score, output_field=FloatField()))
+    ).filter(
+        popularity_score__gt=0
     ).order_by('-popularity_score')[:limit]
     
     # Get product IDs
@@ -166,6 +300,88 @@ def get_trending_products(days=30, limit=8):
     return trending
 
 
+def record_product_sales(order, sign=1):
+    """
+    Add an order to the daily sales buckets (sign=-1 takes it back out,
+    e.g. when the order is cancelled).
+    """
+    quantities = {}
+    for product_id, quantity in order.items.values_list('product_id', 'quantity'):
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    if not quantities:
+        return
+    
+    day = timezone.localdate(order.created_at)
+    
+    with transaction.atomic():
+        # Make sure every bucket exists, then bump them all in one statement
+        ProductSalesDay.objects.bulk_create([
+            ProductSalesDay(product_id=product_id, day=day)
+            for product_id in quantities
+        ], ignore_conflicts=True)
+        
+        ProductSalesDay.objects.filter(
+            product_id__in=quantities,
+            day=day
+        ).update(
+            orders=F('orders') + sign,
+            quantity=F('quantity') + Case(
+                *[When(product_id=pid, then=Value(sign * qty)) for pid, qty in quantities.items()],
+                default=Value(0),
+            )
+        )
+
+
+def rebuild_product_sales(days=90):
+    """
+    Rebuild the daily sales buckets for the last `days` days from order history.
+    Returns the number of buckets written.
+    """
+    start_day = timezone.localdate() - timedelta(days=days)
+    
+    sales = OrderItem.objects.filter(
+        order__created_at__date__gte=start_day
+    ).exclude(
+        order__status='cancelled'
+    ).annotate(
+        day=TruncDate('order__created_at')
+    ).values('product', 'day').annotate(
+        order_count=Count('order', distinct=True),
+        total_quantity=Sum('quantity')
+    )
+    
+    with transaction.atomic():
+        ProductSalesDay.objects.filter(day__gte=start_day).delete()
+        ProductSalesDay.objects.bulk_create([
+            ProductSalesDay(
+                product_id=row['product'],
+                day=row['day'],
+                orders=row['order_count'],
+                quantity=row['total_quantity']
+            )
+            for row in sales
+        ], batch_size=500)
+    
+    return ProductSalesDay.objects.filter(day__gte=start_day).count()
+
+
+def record_order_placed(order):
+    """Update the recommendation indexes once an order's items are written."""
+    record_co_purchases(order)
+    record_product_sales(order)
+    invalidate_user_recommendations(order.user_id)
+
+
+def record_order_status_change(order, previous_status):
+    """Keep the sales buckets in step when an order is cancelled or restored."""
+    if previous_status != 'cancelled' and order.status == 'cancelled':
+        record_product_sales(order, sign=-1)
+        invalidate_user_recommendations(order.user_id)
+    elif previous_status == 'cancelled' and order.status != 'cancelled':
+        record_product_sales(order)
+        invalidate_user_recommendations(order.user_id)
+
+
 def get_recommended_for_you(user, exclude_product=None, limit=6):
     """
     Get personalized recommendations for authenticated users on product detail page.
@@ -181,3 +397,210 @@ def get_recommended_for_you(user, exclude_product=None, limit=6):
         recommendations = [p for p in recommendations if p.id != exclude_product.id]
     
     return recommendations[:limit]
+
+
+# ==================== BATCH VARIANTS ====================
+# Each resolves a whole list of products or users with a constant number of
+# queries, and every Product is fetched once and shared between the results.
+
+def get_similar_products_bulk(products, limit=4):
+    """
+    Similar products for many products at once.
+    Returns {product_id: [Product, ...]}.
+    """
+    similar_ids = _similar_ids_bulk(products, limit)
+    return _resolve_products(similar_ids)
+
+
+def get_frequently_bought_together_bulk(products, limit=3):
+    """
+    Frequently-bought-together products for many products at once, falling
+    back to similar products like get_frequently_bought_together.
+    Returns {product_id: [Product, ...]}.
+    """
+    bought_together_ids = {product.id: [] for product in products}
+    
+    # Top-k co-purchases for every product in one windowed query
+    co_purchases = ProductCoPurchase.objects.filter(
+        product_id__in=bought_together_ids
+    ).annotate(
+        pair_rank=Window(
+            RowNumber(),
+            partition_by=F('product_id'),
+            order_by=[F('count').desc(), F('other_product_id').asc()]
+        )
+    ).filter(
+        pair_rank__lte=limit
+    ).order_by('product_id', 'pair_rank').values_list('product_id', 'other_product_id')
+    
+    for product_id, other_product_id in co_purchases:
+        bought_together_ids[product_id].append(other_product_id)
+    
+    # Fallback to similar products if no order history
+    without_history = [p for p in products if not bought_together_ids[p.id]]
+    bought_together_ids.update(_similar_ids_bulk(without_history, limit))
+    
+    return _resolve_products(bought_together_ids)
+
+
+def get_personalized_recommendations_bulk(users, limit=6):
+    """
+    Personalized recommendations for many users at once, sharing the
+    per-user cache with get_personalized_recommendations.
+    Returns {user_id: [Product, ...]}; anonymous users share the trending
+    products under the None key.
+    """
+    users = list(users)
+    authenticated = [user for user in users if user and user.is_authenticated]
+    has_anonymous = len(authenticated) < len(users)
+    cache_keys = {user.id: f'recs:personalized:user:{user.id}' for user in authenticated}
+    cached = cache.get_many(list(cache_keys.values()))
+    generations = _generations(list(cache_keys))
+    
+    recommended_ids = {}
+    entries = {}
+    for user_id, cache_key in cache_keys.items():
+        entry = cached.get(cache_key)
+        if not entry or entry['generation'] != generations[user_id]:
+            entry = {'generation': generations[user_id], 'limits': {}}
+        entries[user_id] = entry
+        
+        if limit in entry['limits']:
+            _count_cache_lookup('hits')
+            recommended_ids[user_id] = entry['limits'][limit]
+        else:
+            _count_cache_lookup('misses')
+    
+    misses = [user_id for user_id in cache_keys if user_id not in recommended_ids]
+    trending = get_trending_products(limit=limit) if misses or has_anonymous else []
+    
+    if misses:
+        computed = _compute_personalized_ids_bulk(misses, limit, trending)
+        for user_id, product_ids in computed.items():
+            entries[user_id]['limits'][limit] = product_ids
+            recommended_ids[user_id] = product_ids
+        cache.set_many(
+            {cache_keys[user_id]: entries[user_id] for user_id in misses},
+            settings.RECOMMENDATION_CACHE_TIMEOUT
+        )
+    
+    recommendations = _resolve_products(recommended_ids)
+    if has_anonymous:
+        recommendations[None] = trending
+    return recommendations
+
+
+def _compute_personalized_ids_bulk(user_ids, limit, trending):
+    # Categories each user has purchased from (last 90 days)
+    ninety_days_ago = timezone.now() - timedelta(days=90)
+    user_categories = {user_id: set() for user_id in user_ids}
+    for user_id, category in OrderItem.objects.filter(
+        order__user_id__in=user_ids,
+        order__created_at__gte=ninety_days_ago
+    ).values_list('order__user_id', 'product__category').distinct():
+        user_categories[user_id].add(category)
+    
+    # Product IDs each user already purchased
+    user_purchased = {user_id: set() for user_id in user_ids}
+    for user_id, product_id in OrderItem.objects.filter(
+        order__user_id__in=user_ids
+    ).values_list('order__user_id', 'product_id').distinct():
+        user_purchased[user_id].add(product_id)
+    
+    # Popular products per category; keep enough per category that every
+    # user still has 2 left after dropping what they already bought
+    all_categories = set().union(*user_categories.values())
+    max_purchased = max((len(ids) for ids in user_purchased.values()), default=0)
+    candidates = []
+    if all_categories:
+        candidates = Product.objects.filter(
+            category__in=all_categories
+        ).annotate(
+            order_count=Count('orderitem__order', distinct=True)
+        ).filter(
+            order_count__gt=0
+        ).annotate(
+            category_rank=Window(
+                RowNumber(),
+                partition_by=F('category'),
+                order_by=[F('order_count').desc(), F('id').asc()]
+            )
+        ).filter(
+            category_rank__lte=2 + max_purchased
+        ).order_by('-order_count', 'id').values_list('id', 'category')
+    
+    recommended_ids = {}
+    for user_id in user_ids:
+        # Diversify - max 2 products per category
+        product_ids = []
+        category_count = {}
+        for product_id, category in candidates:
+            if len(product_ids) >= limit:
+                break
+            if category not in user_categories[user_id] or product_id in user_purchased[user_id]:
+                continue
+            if category_count.get(category, 0) < 2:
+                product_ids.append(product_id)
+                category_count[category] = category_count.get(category, 0) + 1
+        
+        # If not enough, fill with trending
+        for product in trending[:limit - len(product_ids)]:
+            if product.id not in product_ids:
+                product_ids.append(product.id)
+        
+        recommended_ids[user_id] = product_ids[:limit]
+    
+    return recommended_ids
+
+
+def _similar_ids_bulk(products, limit):
+    similar_ids = {}
+    unindexed = []
+    for product in products:
+        neighbour_ids = get_neighbour_ids(product.id, limit)
+        if neighbour_ids is None:
+            unindexed.append(product.id)
+        else:
+            similar_ids[product.id] = neighbour_ids
+    
+    if unindexed:
+        # Same category, products within ±20% of the price first
+        product_table = Product._meta.db_table
+        placeholders = ', '.join(['%s'] * len(unindexed))
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT source_id, similar_id FROM (
+                    SELECT src.id AS source_id, cand.id AS similar_id,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY src.id
+                               ORDER BY CASE WHEN cand.price BETWEEN src.price * 0.8
+                                                             AND src.price * 1.2
+                                             THEN 0 ELSE 1 END,
+                                        cand.id
+                           ) AS similar_rank
+                    FROM {product_table} src
+                    JOIN {product_table} cand
+                      ON cand.category = src.category AND cand.id <> src.id
+                    WHERE src.id IN ({placeholders})
+                ) ranked
+                WHERE similar_rank <= %s
+                ORDER BY source_id, similar_rank
+            """, [*unindexed, limit])
+            rows = cursor.fetchall()
+        
+        for product_id in unindexed:
+            similar_ids[product_id] = []
+        for source_id, similar_id in rows:
+            similar_ids[source_id].append(similar_id)
+    
+    return similar_ids
+
+
+def _resolve_products(ids_by_key):
+    """Turn {key: [product_id, ...]} into {key: [Product, ...]} with one query."""
+    all_ids = {pid for product_ids in ids_by_key.values() for pid in product_ids}
+    products_dict = Product.objects.in_bulk(all_ids) if all_ids else {}
+    return {
+        key: [products_dict[pid] for pid in product_ids if pid in products_dict]
+        for key, product_ids in ids_by_key.items()
+    }
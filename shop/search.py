@@ -0,0 +1,174 @@
+"""
+Product search backed by an SQLite FTS5 index (shop_product_fts).
+
+The index is an external-content FTS5 table over shop_product, kept in sync
+by triggers. Results are ranked with bm25 (name matches weigh most) and come
+with a highlighted description snippet. Other databases fall back to the
+plain icontains search.
+"""
+import re
+
+from django.db import connection, connections, models
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Product
+
+FTS_TABLE = 'shop_product_fts'
+
+# bm25 column weights: name, description, category
+BM25_WEIGHTS = (10.0, 1.0, 5.0)
+
+SNIPPET_TOKENS = 16
+
+# Private-use markers, swapped for <mark> tags after HTML escaping
+HIGHLIGHT_START = '\ue000'
+HIGHLIGHT_END = '\ue001'
+
+TOKEN_RE = re.compile(r'\w+')
+
+SYNC_TRIGGERS = {
+    'shop_product_fts_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS shop_product_fts_insert AFTER INSERT ON shop_product BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, description, category)
+            VALUES (new.id, new.name, new.description, new.category);
+        END
+    """,
+    'shop_product_fts_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS shop_product_fts_delete AFTER DELETE ON shop_product BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description, category)
+            VALUES ('delete', old.id, old.name, old.description, old.category);
+        END
+    """,
+    'shop_product_fts_update': f"""
+        CREATE TRIGGER IF NOT EXISTS shop_product_fts_update AFTER UPDATE ON shop_product BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description, category)
+            VALUES ('delete', old.id, old.name, old.description, old.category);
+            INSERT INTO {FTS_TABLE}(rowid, name, description, category)
+            VALUES (new.id, new.name, new.description, new.category);
+        END
+    """,
+}
+
+
+def fts_available(using='default'):
+    return connections[using].vendor == 'sqlite'
+
+
+def ensure_search_index(using='default'):
+    """
+    Create any missing sync triggers, re-indexing everything if one was
+    missing. Runs after every migrate because SQLite drops a table's
+    triggers when a migration rebuilds it.
+    """
+    if not fts_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        if cursor.fetchone() is None:
+            return
+
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'shop_product'")
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [name for name in SYNC_TRIGGERS if name not in existing]
+        for name in missing:
+            cursor.execute(SYNC_TRIGGERS[name])
+
+    if missing:
+        rebuild_search_index(using)
+
+
+def rebuild_search_index(using='default'):
+    """Re-index every product from scratch. Returns the number indexed."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return Product.objects.using(using).count()
+
+
+def build_match_expression(query, extra_terms=()):
+    """Any word may match, each as a prefix: '"dog"* OR "food"*'."""
+    tokens = TOKEN_RE.findall(query.lower())
+    tokens += [term for term in extra_terms if term not in tokens]
+    return ' OR '.join(f'"{token}"*' for token in tokens)
+
+
+def _highlight(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(HIGHLIGHT_START, '<mark>')
+        .replace(HIGHLIGHT_END, '</mark>')
+    )
+
+
+class ProductSearchResults:
+    """
+    Lazily evaluated, bm25-ordered search results that Paginator can slice.
+    Each returned product carries a `snippet` with the matches highlighted.
+    """
+
+    def __init__(self, query, extra_terms=()):
+        self.match = build_match_expression(query, extra_terms)
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            if not self.match:
+                self._count = 0
+            else:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+                        [self.match]
+                    )
+                    self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, page):
+        if not isinstance(page, slice):
+            raise TypeError('ProductSearchResults only supports slicing')
+        offset = page.start or 0
+        limit = (page.stop - offset) if page.stop is not None else -1
+        if not self.match or limit == 0:
+            return []
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT rowid, snippet({FTS_TABLE}, 1, %s, %s, '…', %s)
+                FROM {FTS_TABLE}
+                WHERE {FTS_TABLE} MATCH %s
+                ORDER BY bm25({FTS_TABLE}, %s, %s, %s)
+                LIMIT %s OFFSET %s
+            """, [HIGHLIGHT_START, HIGHLIGHT_END, SNIPPET_TOKENS, self.match,
+                  *BM25_WEIGHTS, limit, offset])
+            rows = cursor.fetchall()
+
+        products_dict = Product.objects.in_bulk([product_id for product_id, _ in rows])
+        results = []
+        for product_id, snippet in rows:
+            product = products_dict.get(product_id)
+            if product:
+                product.snippet = _highlight(snippet)
+                results.append(product)
+        return results
+
+
+def search_products(query, extra_terms=()):
+    """
+    Products matching any word of `query` (or of `extra_terms`, e.g. spelling
+    corrections), best matches first. Returns something Paginator can page through.
+    """
+    if fts_available():
+        return ProductSearchResults(query, extra_terms)
+
+    # Split query into words for better matching
+    q_objects = models.Q()
+    for word in [*query.split(), *extra_terms]:
+        q_objects |= (
+            models.Q(name__icontains=word) |
+            models.Q(description__icontains=word) |
+            models.Q(category__icontains=word)
+        )
+    return Product.objects.filter(q_objects).distinct().order_by('id')
@@ -0,0 +1,57 @@
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .catalog import bump_version
+from .models import Product, Size
+from .recommendations import invalidate_all_recommendations
+from .search import ensure_search_index
+from .sizes import sync_size_masks
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    bump_version('catalog')
+
+
+@receiver(m2m_changed, sender=Product.sizes.through)
+def product_sizes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep Product.size_mask in step with sizes.set()/add()/remove()/clear()."""
+    if action == 'pre_clear' and reverse:
+        # size.product_set.clear(): remember who loses the size
+        instance._cleared_product_ids = list(instance.product_set.values_list('id', flat=True))
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            product_ids = [instance.pk]
+        elif action == 'post_clear':
+            product_ids = getattr(instance, '_cleared_product_ids', [])
+        else:
+            product_ids = list(pk_set or [])
+        sync_size_masks(product_ids)
+        bump_version('catalog')
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    """Cached recommendations may point at the deleted product."""
+    bump_version('catalog')
+    invalidate_all_recommendations()
+
+
+@receiver(post_save, sender=Size)
+def size_saved(sender, instance, **kwargs):
+    """Size names appear in the shop facets."""
+    bump_version('catalog')
+
+
+@receiver(post_delete, sender=Size)
+def size_deleted(sender, instance, **kwargs):
+    """The deleted size's bit is still set on the products that had it."""
+    sync_size_masks()
+    bump_version('catalog')
+
+
+@receiver(post_migrate)
+def search_index_migrated(sender, using, **kwargs):
+    """SQLite drops the FTS sync triggers whenever a migration rebuilds shop_product."""
+    if sender.name == 'shop':
+        ensure_search_index(using)
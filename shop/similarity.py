@@ -0,0 +1,199 @@
+"""
+Content-based product similarity index.
+
+Every product is turned into a feature vector (hashed TF-IDF of its name and
+description, category and available sizes) plus its log price. Nearest
+neighbours for the whole catalog are computed in one batched NumPy pass and
+saved as an id-indexed int32 array, so a lookup is a single row slice of a
+memory-mapped file:
+
+    neighbours[product_id, :limit]  ->  ids of the most similar products
+
+The file's mtime is set to the catalog version it was built from, so product
+edits (which bump that version) mark the index stale without any other
+bookkeeping. Rebuilds happen out of band, from build_similarity_index
+(--watch runs it as a single debounced worker).
+"""
+import logging
+import math
+import os
+import re
+import time
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+from .catalog import get_versions
+from .models import Product
+
+# Feature weights (they add up to 1)
+TEXT_WEIGHT = 0.45
+CATEGORY_WEIGHT = 0.25
+SIZE_WEIGHT = 0.1
+PRICE_WEIGHT = 0.2
+
+# Price similarity halves for roughly every 50% price difference
+PRICE_SCALE = 0.6
+
+HASH_DIMENSIONS = 1024
+CHUNK_SIZE = 512
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is',
+    'it', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'with', 'your', 'you',
+}
+
+logger = logging.getLogger(__name__)
+
+_index = None
+_index_mtime = None
+
+
+def index_path():
+    return str(settings.SIMILARITY_INDEX_PATH)
+
+
+def _terms(product):
+    """Name terms count twice, description terms once."""
+    text = f"{product.name} {product.name} {product.description}".lower()
+    return [t for t in TOKEN_RE.findall(text) if len(t) > 1 and t not in STOP_WORDS]
+
+
+def _text_features(products):
+    """Hashed, sublinear TF-IDF vectors, one row per product."""
+    features = np.zeros((len(products), HASH_DIMENSIONS), dtype=np.float32)
+    for row, product in enumerate(products):
+        for term in _terms(product):
+            features[row, zlib.crc32(term.encode()) % HASH_DIMENSIONS] += 1
+
+    nonzero = features > 0
+    features[nonzero] = 1 + np.log(features[nonzero])
+
+    document_frequency = nonzero.sum(axis=0)
+    idf = np.log((1 + len(products)) / (1 + document_frequency)) + 1
+    features *= idf.astype(np.float32)
+    return features
+
+
+def _normalize(features):
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return features / norms
+
+
+def build_index(neighbours=None):
+    """
+    Compute nearest neighbours for every product and write them to
+    SIMILARITY_INDEX_PATH. Returns the number of products indexed.
+    """
+    neighbours = neighbours or settings.SIMILARITY_NEIGHBOURS
+    catalog_version = get_versions('catalog')['catalog']
+    products = list(Product.objects.prefetch_related('sizes').order_by('id'))
+    ids = np.array([p.id for p in products], dtype=np.int64)
+
+    categories = [choice for choice, _ in Product.CATEGORY_CHOICES]
+    size_names = sorted({size.name for p in products for size in p.sizes.all()})
+
+    category_features = np.zeros((len(products), len(categories)), dtype=np.float32)
+    size_features = np.zeros((len(products), len(size_names)), dtype=np.float32)
+    for row, product in enumerate(products):
+        if product.category in categories:
+            category_features[row, categories.index(product.category)] = 1
+        for size in product.sizes.all():
+            size_features[row, size_names.index(size.name)] = 1
+
+    # Weighted cosine similarities all come out of a single dot product
+    features = np.hstack([
+        math.sqrt(TEXT_WEIGHT) * _normalize(_text_features(products)),
+        math.sqrt(CATEGORY_WEIGHT) * category_features,
+        math.sqrt(SIZE_WEIGHT) * _normalize(size_features),
+    ])
+    log_prices = np.log1p(np.array([float(p.price) for p in products], dtype=np.float32))
+
+    k = min(neighbours, max(len(products) - 1, 0))
+    table = np.full((int(ids.max()) + 1 if len(ids) else 0, neighbours), -1, dtype=np.int32)
+
+    for start in range(0, len(products) if k else 0, CHUNK_SIZE):
+        end = min(start + CHUNK_SIZE, len(products))
+        scores = features[start:end] @ features.T
+        scores += PRICE_WEIGHT * np.exp(
+            -np.abs(log_prices[start:end, None] - log_prices[None, :]) / PRICE_SCALE
+        )
+        # A product is never its own neighbour
+        scores[np.arange(end - start), np.arange(start, end)] = -np.inf
+
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+        table[ids[start:end], :k] = ids[np.take_along_axis(top, order, axis=1)]
+
+    # Write next to the live file and swap it in atomically
+    path = index_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(temp_path, table)
+    os.utime(temp_path, ns=(catalog_version, catalog_version))
+    os.replace(temp_path, path)
+
+    return len(products)
+
+
+def load_index():
+    """Memory-map the index file, re-opening it if it has been rebuilt."""
+    global _index, _index_mtime
+    try:
+        mtime = os.stat(index_path()).st_mtime_ns
+    except FileNotFoundError:
+        _index = _index_mtime = None
+        return None
+
+    if mtime != _index_mtime:
+        _index = np.load(index_path(), mmap_mode='r')
+        _index_mtime = mtime
+    return _index
+
+
+def index_version():
+    """Catalog version the loaded index was built from (None without one)."""
+    load_index()
+    return _index_mtime
+
+
+def get_neighbour_ids(product_id, limit):
+    """
+    Ids of the `limit` most similar products, or None when the product
+    is not in the index (no index yet, or added since the last build).
+    """
+    index = load_index()
+    if index is None or product_id >= index.shape[0]:
+        return None
+
+    row = index[product_id, :limit]
+    if row.size == 0 or row[0] < 0:
+        return None
+    return [int(pid) for pid in row if pid >= 0]
+
+
+def index_is_stale():
+    """True when the catalog has changed since the index was built."""
+    built = index_version()
+    return built is None or built < get_versions('catalog')['catalog']
+
+
+def watch_index(interval, debounce, on_build=None):
+    """
+    Rebuild the index whenever it is stale and the catalog has been quiet
+    for `debounce` seconds, checking every `interval` seconds. Runs until
+    interrupted; one of these per deployment replaces per-save rebuilds.
+    """
+    while True:
+        try:
+            quiet_since = get_versions('catalog')['catalog']
+            if index_is_stale() and time.time_ns() - quiet_since >= debounce * 1e9:
+                count = build_index()
+                if on_build:
+                    on_build(count)
+        except Exception:
+            logger.exception("Failed to rebuild similarity index")
+        time.sleep(interval)
@@ -0,0 +1,128 @@
+"""
+Denormalized product sizes.
+
+Each size owns a bit position (Size.bit, handed out densely as sizes are
+created) and Product.size_mask has that bit set for each of the product's
+sizes, so listings can filter on a size and show size names without joining
+through shop_product_sizes. Once all 63 positions are taken, further sizes
+have no bit and are filtered and named through the join instead. The
+m2m_changed signal keeps the masks in sync; the check_size_masks command
+finds (and with --fix repairs) any drift.
+"""
+from django.db.models import F, Q
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+
+from .catalog import get_versions
+from .models import Product, Size
+
+# A signed 64-bit column holds bits 0-62
+SIZE_BITS = 63
+
+_sizes = None
+
+
+def free_size_bit():
+    """The lowest bit position no size holds, or None if all are taken."""
+    taken = set(Size.objects.exclude(bit=None).values_list('bit', flat=True))
+    return next((bit for bit in range(SIZE_BITS) if bit not in taken), None)
+
+
+def has_any_size(bits):
+    """Filter expression: the product has at least one of the sizes in `bits`."""
+    return GreaterThan(F('size_mask').bitand(bits), 0)
+
+
+def get_sizes():
+    """[(size id, name, bit or None)], re-read only when the catalog version changes."""
+    global _sizes
+    version = get_versions('catalog')['catalog']
+    if _sizes is None or _sizes[0] != version:
+        _sizes = (version, list(Size.objects.order_by('id').values_list('id', 'name', 'bit')))
+    return _sizes[1]
+
+
+def get_size_names():
+    """{size id: name}."""
+    return {size_id: name for size_id, name, _ in get_sizes()}
+
+
+def size_filter(name):
+    """Q for products that have a size called `name`."""
+    bits, unmapped = 0, []
+    for size_id, size_name, bit in get_sizes():
+        if size_name == name:
+            if bit is None:
+                unmapped.append(size_id)
+            else:
+                bits |= 1 << bit
+    q = Q(has_any_size(bits))
+    if unmapped:
+        links = Product.sizes.through.objects.filter(size_id__in=unmapped)
+        q |= Q(id__in=links.values('product_id'))
+    return q
+
+
+def unmapped_size_links(product_ids=None):
+    """
+    {product id: {size id}} for the sizes without a bit, which size_mask
+    cannot carry. Empty (and no query) while every size has one.
+    """
+    unmapped = [size_id for size_id, _, bit in get_sizes() if bit is None]
+    if not unmapped:
+        return {}
+    links = Product.sizes.through.objects.filter(size_id__in=unmapped)
+    if product_ids is not None:
+        links = links.filter(product_id__in=product_ids)
+    result = {}
+    for product_id, size_id in links.values_list('product_id', 'size_id'):
+        result.setdefault(product_id, set()).add(size_id)
+    return result
+
+
+def names_from_mask(mask, unmapped_ids=()):
+    """Size names from a size_mask plus any bitless size ids (see unmapped_size_links)."""
+    return [
+        name for size_id, name, bit in get_sizes()
+        if (mask & (1 << bit) if bit is not None else size_id in unmapped_ids)
+    ]
+
+
+def compute_size_masks(product_ids=None):
+    """{product id: mask} from shop_product_sizes, for the given or all products."""
+    products = Product.objects.all()
+    links = Product.sizes.through.objects.all()
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+        links = links.filter(product_id__in=product_ids)
+
+    masks = {product_id: 0 for product_id in products.values_list('id', flat=True)}
+    links = links.filter(size__bit__isnull=False)
+    for product_id, bit in links.values_list('product_id', 'size__bit'):
+        if product_id in masks:
+            masks[product_id] |= 1 << bit
+    return masks
+
+
+def find_stale_size_masks(product_ids=None):
+    """[(product id, stored mask, correct mask)] for every out-of-sync product."""
+    masks = compute_size_masks(product_ids)
+    stored = Product.objects.filter(id__in=masks).values_list('id', 'size_mask')
+    return [
+        (product_id, size_mask, masks[product_id])
+        for product_id, size_mask in stored
+        if size_mask != masks[product_id]
+    ]
+
+
+def sync_size_masks(product_ids=None):
+    """Rewrite the masks that are out of sync. Returns how many changed."""
+    stale = find_stale_size_masks(product_ids)
+    # bulk_update skips auto_now, and the product's timestamp validates its page
+    now = timezone.now()
+    Product.objects.bulk_update(
+        [Product(id=product_id, size_mask=mask, updated_at=now) for product_id, _, mask in stale],
+        ['size_mask', 'updated_at'],
+        batch_size=500,
+    )
+    return len(stale)
@@ -1,3 +1,604 @@
-from django.test import TestCase
+import io
+import json
+import re
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.db.models import F
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from outbox.models import OutgoingEmail
+
+from . import catalog
+from .cart import CartOperationError, add_cart_item, apply_cart_operations
+from .catalog_io import export_rows, import_products
+from .facets import get_facet_counts
+from .models import Cart, CartItem, DatasetVersion, Order, Product, ProductCoPurchase, Size
+from .order_numbers import new_order_number
+from .orders import SHIPPING_CHARGE, place_order
+from .pagination import keyset_page
+from .recommendations import get_personalized_recommendations, get_recommendation_cache_stats
+from .product_cache import _bundle_key, get_product_bundle
+from .sizes import SIZE_BITS, find_stale_size_masks, size_filter
+
+ORDER_FIELDS = {
+    'first_name': 'Test', 'last_name': 'User', 'email': 'test@example.com',
+    'phone': '9800000000', 'address': 'Street 1', 'city': 'Kathmandu',
+    'payment_method': 'cod',
+}
+
+
+def make_product(name, price='10.00', category='clothes', **fields):
+    return Product.objects.create(
+        name=name, category=category, price=Decimal(price),
+        description=f"{name} description", image='products/test.jpg', **fields
+    )
+
+
+def make_request(user):
+    """A bare request with a session, for helpers that take one."""
+    request = RequestFactory().get('/')
+    request.user = user
+    request.session = SessionStore()
+    return request
+
+
+class PlaceOrderTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass')
+        self.cart = Cart.objects.create(user=self.user)
+        self.tee = make_product('Tee', '12.50')
+        self.bowl = make_product('Bowl', '4.25', category='accessories')
+        self.tee_line = CartItem.objects.create(cart=self.cart, product=self.tee, size='M', quantity=2)
+        self.bowl_line = CartItem.objects.create(cart=self.cart, product=self.bowl, quantity=1)
+
+    def test_order_from_whole_cart(self):
+        request = make_request(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = place_order(request, **ORDER_FIELDS)
+
+        self.assertEqual(order.total_amount, Decimal('29.25') + SHIPPING_CHARGE)
+        self.assertEqual(
+            sorted(order.items.values_list('product__name', 'quantity', 'size', 'price')),
+            [('Bowl', 1, '', Decimal('4.25')), ('Tee', 2, 'M', Decimal('12.50'))],
+        )
+        self.assertFalse(CartItem.objects.filter(cart=self.cart).exists())
+        self.assertEqual(request.session['cart_count'], 0)
+        # The co-purchase index is updated once the order commits
+        self.assertTrue(ProductCoPurchase.objects.filter(product=self.tee, other_product=self.bowl).exists())
+
+    def test_buy_now_takes_only_that_line(self):
+        order = place_order(make_request(self.user), self.tee_line.id, **ORDER_FIELDS)
+
+        self.assertEqual(list(order.items.values_list('product_id', flat=True)), [self.tee.id])
+        self.assertEqual(list(CartItem.objects.filter(cart=self.cart)), [self.bowl_line])
+
+    def test_prices_are_read_at_checkout(self):
+        Product.objects.filter(id=self.tee.id).update(price=Decimal('20.00'))
+        order = place_order(make_request(self.user), self.tee_line.id, shipping=Decimal('0'), **ORDER_FIELDS)
+
+        self.assertEqual(order.total_amount, Decimal('40.00'))
+        self.assertEqual(order.items.get().price, Decimal('20.00'))
+
+    def test_empty_cart_places_nothing(self):
+        CartItem.objects.all().delete()
+        self.assertIsNone(place_order(make_request(self.user), **ORDER_FIELDS))
+        self.assertFalse(Order.objects.exists())
+
+    def test_failure_rolls_everything_back(self):
+        with mock.patch('shop.orders.OrderItem.objects.bulk_create', side_effect=RuntimeError('disk full')):
+            with self.assertRaises(RuntimeError):
+                place_order(make_request(self.user), confirmation_email=True, **ORDER_FIELDS)
+
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OutgoingEmail.objects.exists())
+        self.assertEqual(CartItem.objects.filter(cart=self.cart).count(), 2)
+
+    def test_confirmation_email_is_queued(self):
+        order = place_order(make_request(self.user), confirmation_email=True, **ORDER_FIELDS)
+
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.to, [self.user.email])
+        self.assertIn(order.order_number, email.subject + email.body)
+
+
+class AddCartItemTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'pass')
+        self.tee = make_product('Tee')
+
+    def lines(self):
+        return sorted(CartItem.objects.filter(cart__user=self.user).values_list('product_id', 'size', 'quantity'))
+
+    def test_creates_the_cart_and_the_line(self):
+        request = make_request(self.user)
+        item_id, created = add_cart_item(request, self.tee, 'M')
+
+        self.assertTrue(created)
+        self.assertEqual(CartItem.objects.get(id=item_id).cart.user, self.user)
+        self.assertEqual(self.lines(), [(self.tee.id, 'M', 1)])
+        self.assertEqual(request.session['cart_count'], 1)
+
+    def test_existing_line_is_left_alone(self):
+        request = make_request(self.user)
+        add_cart_item(request, self.tee, 'M')
+        item_id, created = add_cart_item(request, self.tee, 'M')
+
+        self.assertEqual((item_id, created), (None, False))
+        self.assertEqual(self.lines(), [(self.tee.id, 'M', 1)])
+
+    def test_increment_bumps_the_existing_line(self):
+        request = make_request(self.user)
+        first_id, _ = add_cart_item(request, self.tee, 'M')
+        item_id, created = add_cart_item(request, self.tee, 'M', increment=True)
+
+        self.assertEqual((item_id, created), (first_id, False))
+        self.assertEqual(self.lines(), [(self.tee.id, 'M', 2)])
+        self.assertEqual(request.session['cart_count'], 1)
+
+    def test_sizes_are_separate_lines(self):
+        request = make_request(self.user)
+        add_cart_item(request, self.tee, 'M')
+        add_cart_item(request, self.tee, 'L')
+        add_cart_item(request, self.tee)
+
+        self.assertEqual(self.lines(), [(self.tee.id, '', 1), (self.tee.id, 'L', 1), (self.tee.id, 'M', 1)])
+
+    def test_add_to_cart_view(self):
+        self.client.force_login(self.user)
+        url = reverse('add_to_cart_ajax', args=[self.tee.id])
+        body = json.dumps({'size': 'S'})
+
+        first = self.client.post(url, body, content_type='application/json').json()
+        second = self.client.post(url, body, content_type='application/json').json()
+
+        self.assertEqual((first['success'], first['cart_count']), (True, 1))
+        self.assertTrue(second['already_in_cart'])
+        self.assertEqual(self.lines(), [(self.tee.id, 'S', 1)])
+
+
+class CartOperationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('editor', 'editor@example.com', 'pass')
+        self.cart = Cart.objects.create(user=self.user)
+        self.tee = make_product('Tee')
+        self.bowl = make_product('Bowl', category='accessories')
+        self.medium = CartItem.objects.create(cart=self.cart, product=self.tee, size='M', quantity=1)
+        self.large = CartItem.objects.create(cart=self.cart, product=self.tee, size='L', quantity=2)
+
+    def lines(self):
+        return sorted(CartItem.objects.filter(cart=self.cart).values_list('id', 'product_id', 'size', 'quantity'))
+
+    def test_batch_is_applied(self):
+        apply_cart_operations(self.user, [
+            {'op': 'add', 'product_id': self.bowl.id, 'quantity': 2},
+            {'op': 'set_quantity', 'item_id': self.medium.id, 'quantity': 3},
+            {'op': 'remove', 'item_id': self.large.id},
+        ])
+
+        lines = self.lines()
+        self.assertEqual(lines[0], (self.medium.id, self.tee.id, 'M', 3))
+        self.assertEqual(lines[1][1:], (self.bowl.id, '', 2))
+        self.assertEqual(len(lines), 2)
+
+    def test_adding_an_existing_line_adds_to_it(self):
+        apply_cart_operations(self.user, [{'op': 'add', 'product_id': self.tee.id, 'size': 'M', 'quantity': 4}])
+        self.assertIn((self.medium.id, self.tee.id, 'M', 5), self.lines())
+
+    def test_moving_onto_an_existing_size_merges(self):
+        apply_cart_operations(self.user, [{'op': 'set_size', 'item_id': self.medium.id, 'size': 'L'}])
+        self.assertEqual(self.lines(), [(self.large.id, self.tee.id, 'L', 3)])
+
+    def test_sizes_can_trade_places(self):
+        # M moves to S, then L takes the freed M within the same batch
+        apply_cart_operations(self.user, [
+            {'op': 'set_size', 'item_id': self.medium.id, 'size': 'S'},
+            {'op': 'set_size', 'item_id': self.large.id, 'size': 'M'},
+        ])
+        self.assertEqual(self.lines(), [
+            (self.medium.id, self.tee.id, 'S', 1),
+            (self.large.id, self.tee.id, 'M', 2),
+        ])
+
+    def test_bad_batch_changes_nothing(self):
+        before = self.lines()
+        for operations in (
+            [],
+            [{'op': 'explode'}],
+            [{'op': 'remove', 'item_id': self.medium.id}, {'op': 'set_quantity', 'item_id': 999999, 'quantity': 1}],
+            [{'op': 'set_quantity', 'item_id': self.medium.id, 'quantity': -1}],
+        ):
+            with self.subTest(operations=operations), self.assertRaises(CartOperationError):
+                apply_cart_operations(self.user, operations)
+        self.assertEqual(self.lines(), before)
+
+    def test_cart_update_view(self):
+        self.client.force_login(self.user)
+        url = reverse('cart_update')
+
+        response = self.client.post(url, json.dumps({'operations': [
+            {'op': 'set_quantity', 'item_id': self.large.id, 'quantity': 0},
+        ]}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([item['id'] for item in data['items']], [self.medium.id])
+        self.assertEqual(data['cart_count'], 1)
+
+        response = self.client.post(url, 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, json.dumps({'operations': [{'op': 'explode'}]}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Repeated prices make the id tie-breaker matter
+        prices = ['5.00', '9.99', '5.00', '20.00', '9.99', '5.00', '1.50']
+        cls.products = [make_product(f"Item {i}", price) for i, price in enumerate(prices)]
+
+    def walk(self, sort, per_page=2):
+        """Ids of every page in order, following the cursors."""
+        ids, cursor = [], None
+        while True:
+            page, cursor = keyset_page(Product.objects.all(), sort, cursor, per_page)
+            self.assertLessEqual(len(page), per_page)
+            ids += [product.id for product in page]
+            if cursor is None:
+                return ids
+
+    def test_every_sort_visits_each_product_once_in_order(self):
+        expected = {
+            None: sorted(self.products, key=lambda p: p.id),
+            'price_low': sorted(self.products, key=lambda p: (p.price, p.id)),
+            'price_high': sorted(self.products, key=lambda p: (p.price, p.id), reverse=True),
+        }
+        for sort, products in expected.items():
+            with self.subTest(sort=sort):
+                self.assertEqual(self.walk(sort), [p.id for p in products])
+
+    def test_last_page_has_no_cursor(self):
+        page, cursor = keyset_page(Product.objects.all(), None, None, len(self.products))
+        self.assertEqual(len(page), len(self.products))
+        self.assertIsNone(cursor)
+
+    def test_bad_cursor_starts_over(self):
+        first, _ = keyset_page(Product.objects.all(), 'price_low', None, 3)
+        for cursor in ('garbage', 'W10', 'WyJ4IiwgMV0'):
+            with self.subTest(cursor=cursor):
+                page, _ = keyset_page(Product.objects.all(), 'price_low', cursor, 3)
+                self.assertEqual(page, first)
+
+    def test_products_added_meanwhile_do_not_shift_pages(self):
+        first, cursor = keyset_page(Product.objects.all(), None, None, 3)
+        make_product('Newcomer')
+        second, _ = keyset_page(Product.objects.all(), None, cursor, 3)
+        self.assertEqual([p.id for p in second], [p.id for p in self.products[3:6]])
+
+    @mock.patch('shop.views.SHOP_PRODUCTS_PER_PAGE', 2)
+    def test_infinite_scroll_endpoint_follows_next_query(self):
+        url = reverse('shop_products')
+        data = self.client.get(url, {'sort': 'price_high'}).json()
+        seen = [product['id'] for product in data['products']]
+        while data['next_query']:
+            data = self.client.get(f"{url}?{data['next_query']}").json()
+            seen += [product['id'] for product in data['products']]
+        self.assertEqual(seen, [p.id for p in sorted(self.products, key=lambda p: (p.price, p.id), reverse=True)])
+
+
+class SizeMaskTests(TestCase):
+
+    def setUp(self):
+        self.small, self.medium, self.large = [Size.objects.create(name=name) for name in ('S', 'M', 'L')]
+        self.tee = make_product('Tee')
+        self.hoodie = make_product('Hoodie')
+
+    def mask(self, product):
+        product.refresh_from_db()
+        return product.size_mask
+
+    def bits(self, *sizes):
+        return sum(1 << size.bit for size in sizes)
+
+    def test_sizes_get_dense_bits(self):
+        self.assertEqual([self.small.bit, self.medium.bit, self.large.bit], [0, 1, 2])
+        self.medium.delete()
+        self.assertEqual(Size.objects.create(name='XL').bit, 1)
+
+    def test_m2m_changes_keep_the_mask_in_sync(self):
+        self.tee.sizes.set([self.small, self.medium])
+        self.assertEqual(self.mask(self.tee), self.bits(self.small, self.medium))
+        self.assertEqual(self.tee.size_names, ['S', 'M'])
+
+        self.tee.sizes.remove(self.small)
+        self.assertEqual(self.mask(self.tee), self.bits(self.medium))
+
+        # From the size's side of the relation too
+        self.large.product_set.add(self.tee, self.hoodie)
+        self.assertEqual(self.mask(self.tee), self.bits(self.medium, self.large))
+        self.assertEqual(self.mask(self.hoodie), self.bits(self.large))
+        self.large.product_set.clear()
+        self.assertEqual(self.mask(self.hoodie), 0)
+
+        self.tee.sizes.clear()
+        self.assertEqual(self.mask(self.tee), 0)
+        self.assertEqual(find_stale_size_masks(), [])
+
+    def test_deleting_a_size_clears_its_bit(self):
+        self.tee.sizes.set([self.small, self.medium])
+        self.medium.delete()
+        self.assertEqual(self.mask(self.tee), self.bits(self.small))
+
+    def test_filter_and_facets_use_the_mask(self):
+        self.tee.sizes.set([self.small])
+        self.hoodie.sizes.set([self.small, self.large])
+
+        self.assertEqual(set(Product.objects.filter(size_filter('S'))), {self.tee, self.hoodie})
+        self.assertEqual(list(Product.objects.filter(size_filter('L'))), [self.hoodie])
+        self.assertFalse(Product.objects.filter(size_filter('XXL')).exists())
+        self.assertEqual(get_facet_counts()['size'], {'S': 2, 'M': 0, 'L': 1})
+
+    def test_sizes_past_the_last_bit_fall_back_to_the_join(self):
+        Size.objects.bulk_create([Size(name=f"N{bit}", bit=bit) for bit in range(3, SIZE_BITS)])
+        extra = Size.objects.create(name='Giant')
+        self.assertIsNone(extra.bit)
+
+        self.tee.sizes.set([self.small, extra])
+        self.assertEqual(self.mask(self.tee), self.bits(self.small))
+        self.assertEqual(self.tee.size_names, ['S', 'Giant'])
+        self.assertEqual(list(Product.objects.filter(size_filter('Giant'))), [self.tee])
+        self.assertEqual(get_facet_counts()['size']['Giant'], 1)
+        self.assertEqual({row['slug']: row['sizes'] for row in export_rows()}[self.tee.slug], 'S|Giant')
+
+    def test_check_size_masks_repairs_drift(self):
+        self.tee.sizes.set([self.small, self.large])
+        Product.objects.filter(id=self.tee.id).update(size_mask=0)
+
+        out = io.StringIO()
+        call_command('check_size_masks', '--fix', stdout=out)
+        self.assertIn('Fixed 1', out.getvalue())
+        self.assertEqual(self.mask(self.tee), self.bits(self.small, self.large))
+
+
+class ConditionalPageTests(TestCase):
+
+    def setUp(self):
+        self.tee = make_product('Tee')
+        self.bowl = make_product('Bowl', category='accessories')
+        self.urls = [reverse('shop_home'), reverse('productdetails', args=[self.tee.slug])]
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code
+
+    def test_unchanged_pages_answer_304(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.client.get(url)  # Picks up the CSRF cookie
+                self.assertEqual(self.revalidate(url, self.etag(url)), 304)
+
+    def test_editing_a_product_changes_the_etag(self):
+        for url in self.urls:
+            self.client.get(url)
+        etags = {url: self.etag(url) for url in self.urls}
+
+        self.tee.price = Decimal('99.00')
+        self.tee.save()
+
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.revalidate(url, etag), 200)
+                self.assertNotEqual(self.etag(url), etag)
+
+    def test_anonymous_pages_send_last_modified(self):
+        response = self.client.get(self.urls[0])
+        self.assertIn('Last-Modified', response)
+
+    def test_cart_changes_change_the_etag(self):
+        user = User.objects.create_user('visitor', 'visitor@example.com', 'pass')
+        self.client.force_login(user)
+        url = self.urls[1]
+        self.client.get(url)
+        etag = self.etag(url)
+        self.assertNotIn('Last-Modified', self.client.get(url))
+
+        self.client.post(
+            reverse('add_to_cart_ajax', args=[self.tee.id]), json.dumps({'size': ''}), content_type='application/json'
+        )
+        self.assertEqual(self.revalidate(url, etag), 200)
+
+
+class OrderNumberTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('numbered', 'numbered@example.com', 'pass')
+
+    def create_order(self, **fields):
+        return Order.objects.create(user=self.user, total_amount=Decimal('10.00'), **{**ORDER_FIELDS, **fields})
+
+    def test_format_and_uniqueness(self):
+        numbers = [new_order_number() for _ in range(5000)]
+        self.assertTrue(all(re.fullmatch(r'ORD-[0-9A-Z]{12}', number) for number in numbers))
+        self.assertEqual(len(set(numbers)), len(numbers))
+
+    def test_save_assigns_a_number_once(self):
+        order = self.create_order()
+        number = order.order_number
+        self.assertRegex(number, r'^ORD-[0-9A-Z]{12}$')
+        order.save()
+        self.assertEqual(Order.objects.get(id=order.id).order_number, number)
+
+    def test_clash_is_retried_with_a_fresh_number(self):
+        taken = self.create_order().order_number
+        numbers = iter([taken, 'ORD-FRESHNUMBER'])
+        with mock.patch('shop.models.new_order_number', lambda: next(numbers)):
+            order = self.create_order()
+        self.assertEqual(order.order_number, 'ORD-FRESHNUMBER')
+
+    def test_repeated_clashes_give_up(self):
+        taken = self.create_order().order_number
+        with mock.patch('shop.models.new_order_number', return_value=taken) as generate:
+            with self.assertRaises(IntegrityError):
+                self.create_order()
+        self.assertEqual(generate.call_count, Order.ORDER_NUMBER_ATTEMPTS)
+
+    def test_other_integrity_errors_are_not_retried(self):
+        with mock.patch('shop.models.new_order_number', side_effect=new_order_number) as generate:
+            with self.assertRaises(IntegrityError):
+                Order.objects.create(user_id=None, total_amount=Decimal('10.00'), **ORDER_FIELDS)
+        self.assertEqual(generate.call_count, 1)
+
+
+class FacetLinkTests(TestCase):
+
+    def setUp(self):
+        make_product('Tee')
+        make_product('Kibble', category='food')
+
+    def links(self, query):
+        facets = self.client.get(f"{reverse('shop_home')}?{query}").context['facets']
+        return {option['value']: option['url'] for option in facets['category']}
+
+    def test_categories_toggle_one_at_a_time(self):
+        links = self.links('category=food&category=clothes&sort=price_low')
+        self.assertEqual(links['food'], '?category=clothes&sort=price_low')
+        self.assertEqual(links['clothes'], '?category=food&sort=price_low')
+        self.assertEqual(links['accessories'], '?category=food&category=clothes&category=accessories&sort=price_low')
+
+    def test_picking_a_category_replaces_all(self):
+        self.assertEqual(self.links('category=all')['food'], '?category=food')
+
+
+class ProductBundleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('bundler', 'bundler@example.com', 'pass')
+        self.tee, self.bowl, self.collar = [make_product(name) for name in ('Tee', 'Bowl', 'Collar')]
+        for product in (self.tee, self.bowl, self.collar):
+            get_product_bundle(product.slug)
+
+    def cached(self, product):
+        return cache.get(_bundle_key(product.id)) is not None
+
+    def test_hit_reads_the_product_and_its_recommendations(self):
+        with self.assertNumQueries(2):
+            bundle = get_product_bundle(self.tee.slug)
+        self.assertEqual(bundle['product'], self.tee)
+        self.assertEqual(set(bundle['similar_products']), {self.bowl, self.collar})
+
+    def test_order_retires_only_its_products(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.tee)
+        CartItem.objects.create(cart=cart, product=self.bowl)
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(make_request(self.user), **ORDER_FIELDS)
+
+        self.assertFalse(self.cached(self.tee))
+        self.assertFalse(self.cached(self.bowl))
+        self.assertTrue(self.cached(self.collar))
+        self.assertEqual(get_product_bundle(self.tee.slug)['frequently_bought'], [self.bowl])
+
+    def test_cached_bundles_show_current_products(self):
+        self.bowl.name = 'Renamed bowl'
+        self.bowl.save()
+        self.collar.delete()
+
+        bundle = get_product_bundle(self.tee.slug)
+        self.assertEqual([p.name for p in bundle['similar_products']], ['Renamed bowl'])
+
+    def test_cached_bundles_show_current_sizes(self):
+        medium = Size.objects.create(name='M')
+        self.tee.sizes.add(medium)
+        self.assertEqual(get_product_bundle(self.tee.slug)['sizes'], ['M'])
+
+        medium.name = 'Medium'
+        medium.save()
+        self.assertEqual(get_product_bundle(self.tee.slug)['sizes'], ['Medium'])
+
+        medium.product_set.remove(self.tee)
+        self.assertEqual(get_product_bundle(self.tee.slug)['sizes'], [])
+
+    def test_size_sync_stamps_updated_at(self):
+        before = Product.objects.get(id=self.tee.id).updated_at
+        Size.objects.create(name='L').product_set.add(self.tee)
+        self.assertGreater(Product.objects.get(id=self.tee.id).updated_at, before)
+
+
+class CatalogImportTests(TestCase):
+
+    def setUp(self):
+        self.tee = make_product('Tee', slug='tee')
+
+    def row(self, **fields):
+        return {'name': 'Tee', 'category': 'clothes', 'price': '10', 'image': '', **fields}
+
+    def test_repeated_slug_in_a_batch_updates_once(self):
+        result = import_products([
+            self.row(slug='tee', price='11', sizes='S|M'),
+            self.row(slug='tee', price='12', sizes='M|L|M'),
+        ])
+
+        self.assertEqual((result.created, result.updated), (0, 1))
+        self.assertEqual([number for number, _ in result.errors], [1])
+        self.tee.refresh_from_db()
+        self.assertEqual(self.tee.price, Decimal('12.00'))
+        self.assertEqual(sorted(self.tee.sizes.values_list('name', flat=True)), ['L', 'M'])
+
+    def test_image_paths_outside_products_are_row_errors(self):
+        result = import_products([
+            self.row(slug='tee', image='../../etc/passwd'),
+            self.row(slug='tee-2', image='/etc/passwd'),
+            self.row(slug='tee-3', image='products/../../settings.py'),
+        ])
+
+        self.assertEqual((result.created, result.updated), (0, 0))
+        self.assertEqual([number for number, _ in result.errors], [1, 2, 3])
+
+
+class RecommendationCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('regular', 'regular@example.com', 'pass')
+        self.tee, self.hoodie = make_product('Tee'), make_product('Hoodie')
+
+    def misses(self):
+        get_personalized_recommendations(self.user)
+        return get_recommendation_cache_stats()['misses']
+
+    def bump_elsewhere(self, name):
+        """What another worker's invalidation looks like from this process."""
+        DatasetVersion.objects.filter(name=name).update(version=F('version') + 1)
+        catalog._checked.clear()
+
+    def test_repeat_lookups_hit_the_cache(self):
+        self.assertEqual(self.misses(), 1)
+        self.assertEqual(self.misses(), 1)
+
+    def test_invalidations_from_other_processes_are_seen(self):
+        self.misses()
+        self.bump_elsewhere(f'recommendations:{self.user.id}')
+        self.assertEqual(self.misses(), 2)
+        self.bump_elsewhere('recommendations')
+        self.assertEqual(self.misses(), 3)
+
+    def test_deleted_products_are_not_recommended(self):
+        tee_id = self.tee.id
+        self.assertIn(tee_id, [p.id for p in get_personalized_recommendations(self.user)])
+        self.tee.delete()
+        self.assertNotIn(tee_id, [p.id for p in get_personalized_recommendations(self.user)])
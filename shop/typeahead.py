@@ -0,0 +1,108 @@
+"""
+In-process prefix index for search-box suggestions.
+
+Product names, categories and adoptable dog breeds are kept as a sorted list
+of normalised keys, one per word start, so a keystroke is a bisect plus a
+short scan. The index is rebuilt lazily whenever the catalog or adoption
+version token changes; serving a suggestion never touches the database.
+"""
+import re
+import threading
+from bisect import bisect_left
+from urllib.parse import urlencode
+
+from django.urls import reverse
+
+from dog.models import Dog
+
+from .catalog import get_versions
+from .models import Product
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Suggestion kinds, in the order they are shown for equally good matches
+KIND_ORDER = {'category': 0, 'product': 1, 'breed': 2}
+
+_index = None
+_index_versions = None
+_build_lock = threading.Lock()
+
+
+def normalize(text):
+    return ' '.join(TOKEN_RE.findall(text.lower()))
+
+
+class PrefixIndex:
+
+    def __init__(self, entries):
+        self.entries = entries
+        keys = []
+        for position, (label, kind, url) in enumerate(entries):
+            words = normalize(label).split(' ')
+            # One key per word start: "fun summer tee", "summer tee", "tee"
+            for offset in range(len(words)):
+                keys.append((' '.join(words[offset:]), offset, position))
+        keys.sort()
+        self.keys = [key for key, _, _ in keys]
+        self.refs = [(offset, position) for _, offset, position in keys]
+
+    def search(self, prefix, limit=8):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        matches = {}
+        start = bisect_left(self.keys, prefix)
+        for i in range(start, min(start + limit * 10, len(self.keys))):
+            if not self.keys[i].startswith(prefix):
+                break
+            offset, position = self.refs[i]
+            matches[position] = min(offset, matches.get(position, offset))
+
+        # Matches at the start of a label first, then by kind, then shortest
+        ranked = sorted(
+            matches.items(),
+            key=lambda match: (
+                match[1] > 0,
+                KIND_ORDER[self.entries[match[0]][1]],
+                len(self.entries[match[0]][0]),
+            )
+        )
+        return [
+            {'label': label, 'type': kind, 'url': url}
+            for label, kind, url in (self.entries[position] for position, _ in ranked[:limit])
+        ]
+
+
+def build_index():
+    entries = []
+
+    shop_url = reverse('shop_home')
+    for value, label in Product.CATEGORY_CHOICES:
+        entries.append((label, 'category', f"{shop_url}?{urlencode({'category': value})}"))
+
+    for name, slug in Product.objects.exclude(slug__isnull=True).values_list('name', 'slug'):
+        entries.append((name, 'product', reverse('productdetails', args=[slug])))
+
+    dogs_url = reverse('dog:dog_list')
+    breeds = Dog.objects.filter(is_approved=True, is_adopted=False).values_list('breed', flat=True)
+    for breed in sorted({breed.strip() for breed in breeds if breed.strip()}, key=str.lower):
+        entries.append((breed, 'breed', f"{dogs_url}?{urlencode({'breed': breed})}"))
+
+    return PrefixIndex(entries)
+
+
+def get_index():
+    """The current index, rebuilt first if the catalog or adoptions changed."""
+    global _index, _index_versions
+    versions = get_versions('catalog', 'adoption')
+    if _index is None or versions != _index_versions:
+        with _build_lock:
+            if _index is None or versions != _index_versions:
+                _index = build_index()
+                _index_versions = versions
+    return _index
+
+
+def get_suggestions(query, limit=8):
+    return get_index().search(query, limit)
@@ -6,7 +6,10 @@ from django.conf.urls.static import static
 urlpatterns = [
     path('shop', views.shop_home, name='shop_home'),
     path('search/', views.search, name='search'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
+    path('shop/products/', views.shop_products, name='shop_products'),
     path('cart/', views.cart_view, name='cart_view'),
+    path('cart/update/', views.cart_update, name='cart_update'),
     path('checkout/', views.checkout_view, name='checkout'),
     path('add-to-cart-ajax/<int:product_id>/', views.add_to_cart_ajax, name='add_to_cart_ajax'),
     path('buy-now-ajax/<int:product_id>/', views.buy_now_ajax, name='buy_now_ajax'),
@@ -1,85 +1,35 @@
 from django.shortcuts import render,redirect,get_object_or_404
 from django.contrib.auth.decorators import login_required
-from .models import Product, Cart, CartItem, Order, OrderItem
+from .models import Product, CartItem, Order
 from userauth.models import Address
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.views.decorators.http import require_POST
-from django.db import models
+from django.db import IntegrityError
 from django.contrib import messages
+from django.core.paginator import Paginator
 from .recommendations import (
-    get_similar_products,
-    get_frequently_bought_together,
     get_trending_products,
-    get_personalized_recommendations
+    get_personalized_recommendations,
+    record_order_status_change,
 )
-from django.core.mail import send_mail, EmailMultiAlternatives
+from .search import search_products
+from .typeahead import get_suggestions
+from .fuzzy import correct_words, words_of
+from .pagination import keyset_page
+from .facets import PRICE_BUCKETS, get_facet_counts, product_filter
+from .conditional import conditional_page, ns_to_datetime
+from .similarity import index_version
+from .product_cache import get_product_bundle
+from .orders import SHIPPING_CHARGE, place_order
+from . import khalti
+from .cart import CartOperationError, add_cart_item, apply_cart_operations, get_cart_count, get_cart_summary, refresh_cart_count
 from django.template.loader import render_to_string
+from django.urls import reverse
 import json
-import requests
 
-def send_order_confirmation_email(order):
-    """Send HTML order confirmation email to customer"""
-    try:
-        subject = f'Order Confirmation - #{order.order_number}'
-        
-        # Get site URL
-        site_url = settings.SITE_URL if hasattr(settings, 'SITE_URL') else 'http://127.0.0.1:8000'
-        
-        # Render HTML email
-        html_content = render_to_string('emails/order_confirmation.html', {
-            'order': order,
-            'site_url': site_url,
-        })
-        
-        # Plain text fallback
-        text_content = f"""
-Dear {order.user.first_name},
-
-Thank you for your order!
-
-Order Details:
-Order Number: #{order.order_number}
-Order Date: {order.created_at.strftime('%B %d, %Y at %I:%M %p')}
-Total Amount: NPR {order.total_amount}
-
-Items Ordered:
-"""
-        for item in order.items.all():
-            text_content += f"\n- {item.product.name} x {item.quantity}"
-            if item.size:
-                text_content += f" (Size: {item.size})"
-            text_content += f" - NPR {item.subtotal}"
-        
-        text_content += f"""
-
-Shipping Address:
-{order.first_name} {order.last_name}
-{order.address}
-{order.city}
-
-We'll send you another email when your order ships.
-
-Thank you for shopping with Pethood!
-
-Best regards,
-The Pethood Team
-"""
-        
-        # Create email with HTML
-        email = EmailMultiAlternatives(
-            subject=subject,
-            body=text_content,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[order.user.email]
-        )
-        email.attach_alternative(html_content, "text/html")
-        email.send(fail_silently=True)
-        
-        return True
-    except Exception as e:
-        print(f"Failed to send order confirmation email: {e}")
-        return False
+SEARCH_RESULTS_PER_PAGE = 12
+SHOP_PRODUCTS_PER_PAGE = 24
 
 # Create your views here.
 # def shop_home(request):
@@ -90,79 +40,163 @@ def search(request):
     """Search products by name, description, or category"""
     query = request.GET.get('q', '').strip()
     
+    corrected_query = None
+    
     if query:
-        # Split query into words for better matching
-        words = query.split()
-        
-        # Build query to search for each word
-        q_objects = models.Q()
-        for word in words:
-            q_objects |= (
-                models.Q(name__icontains=word) |
-                models.Q(description__icontains=word) |
-                models.Q(category__icontains=word)
-            )
-        
-        products = Product.objects.filter(q_objects).distinct()
+        # Misspelt words also search for their closest catalog word
+        corrections = correct_words(query, 'catalog')
+        if corrections:
+            corrected_query = ' '.join(corrections.get(word, word) for word in words_of(query))
+    
+        # Ranked full-text search, paginated
+        paginator = Paginator(search_products(query, corrections.values()), SEARCH_RESULTS_PER_PAGE)
+        page_obj = paginator.get_page(request.GET.get('page'))
+        products = page_obj.object_list
     else:
-        products = Product.objects.none()
+        page_obj = None
+        products = []
     
     context = {
         'products': products,
+        'page_obj': page_obj,
         'query': query,
+        'corrected_query': corrected_query,
         'categories': Product.CATEGORY_CHOICES,
     }
     return render(request, 'search_results.html', context)
 
-def shop_home(request):
+def search_suggest(request):
+    """JSON typeahead suggestions for the search box"""
+    query = request.GET.get('q', '').strip()
+    return JsonResponse({
+        'query': query,
+        'suggestions': get_suggestions(query),
+    })
+
+def _shop_listing(request):
+    """One keyset page of the catalog for the current filters and sort."""
     selected_categories = request.GET.getlist('category')
     sort_option = request.GET.get('sort')
     selected_size = request.GET.get('size')  # optional size filter
+    selected_price = request.GET.get('price')  # optional price bucket
 
-    products = Product.objects.all()
-
-    # Filter by category
-    if selected_categories and "all" not in selected_categories:
-        products = products.filter(category__in=selected_categories)
-
-    # Filter by size (only applies to Clothes/Accessories)
-    if selected_size:
-        products = products.filter(sizes__name=selected_size)
+    # Category, size (only applies to Clothes/Accessories) and price filters
+    products = Product.objects.filter(product_filter(selected_categories, selected_size, selected_price))
 
-    # Sorting
-    if sort_option == "price_low":
-        products = products.order_by('price')
-    elif sort_option == "price_high":
-        products = products.order_by('-price')
+    # Sorting and paging share one (price, id) / id keyset
+    products, next_cursor = keyset_page(
+        products, sort_option, request.GET.get('cursor'), SHOP_PRODUCTS_PER_PAGE
+    )
 
-    context = {
+    next_params = request.GET.copy()
+    next_params['cursor'] = next_cursor or ''
+    return {
         "products": products,
+        "next_cursor": next_cursor,
+        "next_query": next_params.urlencode() if next_cursor else '',
         "categories": Product.CATEGORY_CHOICES,
         "selected_categories": selected_categories,
-        
+        "selected_size": selected_size or '',
+        "selected_price": selected_price or '',
+        "sort": sort_option or '',
     }
+
+def _facet_links(request, listing):
+    """Sidebar options with their counts and a link that toggles each one."""
+    counts = get_facet_counts(listing['selected_categories'], listing['selected_size'], listing['selected_price'])
+    labels = {
+        'category': dict(Product.CATEGORY_CHOICES),
+        'size': {name: name for name in counts['size']},
+        'price': {key: label for key, label, _, _ in PRICE_BUCKETS},
+    }
+    selected = {
+        'category': listing['selected_categories'],
+        'size': [listing['selected_size']],
+        'price': [listing['selected_price']],
+    }
+
+    facets = {}
+    for facet, facet_counts in counts.items():
+        options = []
+        for value, count in facet_counts.items():
+            is_selected = value in selected[facet]
+            params = request.GET.copy()
+            params.pop('cursor', None)
+            if facet == 'category':
+                # Categories combine; toggle just this one
+                values = [v for v in params.getlist(facet) if v not in (value, 'all')]
+                if not is_selected:
+                    values.append(value)
+                params.setlist(facet, values)
+            elif is_selected:
+                params.pop(facet, None)
+            else:
+                params[facet] = value
+            options.append({
+                'value': value,
+                'label': labels[facet][value],
+                'count': count,
+                'selected': is_selected,
+                'url': f"?{params.urlencode()}",
+            })
+        facets[facet] = options
+    return facets
+
+@conditional_page('catalog')
+def shop_home(request):
+    context = _shop_listing(request)
+    context['facets'] = _facet_links(request, context)
     return render(request, "shop.html", context)
 
+def shop_products(request):
+    """JSON page of the catalog for infinite scroll"""
+    listing = _shop_listing(request)
+    return JsonResponse({
+        'products': [
+            {
+                'id': product.id,
+                'name': product.name,
+                'url': reverse('productdetails', args=[product.slug]),
+                'price': str(product.price),
+                'image': product.image.url if product.image else '',
+            }
+            for product in listing['products']
+        ],
+        'html': render_to_string('product_cards.html', {'products': listing['products']}, request=request),
+        'next_cursor': listing['next_cursor'],
+        'next_query': listing['next_query'],
+    })
+
+def _product_page_state(request, slug):
+    """The product's own timestamp and the similarity index it was rendered with."""
+    updated_at = Product.objects.filter(slug=slug).values_list('updated_at', flat=True).first()
+    similarity_version = index_version()
+    last_modified = updated_at
+    if updated_at and similarity_version:
+        last_modified = max(updated_at, ns_to_datetime(similarity_version))
+    return f"product={slug}:{updated_at}:{similarity_version}", last_modified
+
+@conditional_page('catalog', 'co_purchases', extra=_product_page_state)
 def productdetails(request, slug):
-    product = get_object_or_404(Product, slug=slug)
+    # Sizes and recommendations are cached per product version
+    bundle = get_product_bundle(slug)
+    if bundle is None:
+        raise Http404("No Product matches the given query.")
+    product = bundle['product']
     
     # Get cart items for logged-in users to check if product+size combo exists
     cart_items_in_cart = []
     if request.user.is_authenticated:
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        # Get all cart items for this product with their sizes
-        cart_items = CartItem.objects.filter(cart=cart, product=product)
-        cart_items_in_cart = [item.size for item in cart_items]
-    
-    # Get recommendations
-    similar_products = get_similar_products(product, limit=4)
-    frequently_bought = get_frequently_bought_together(product, limit=3)
+        cart_items_in_cart = list(
+            CartItem.objects.filter(cart__user=request.user, product=product).values_list('size', flat=True)
+        )
     
     return render(request, 'productdetails.html', {
         'product': product,
+        'sizes': bundle['sizes'],
         'cart_items_in_cart': cart_items_in_cart,
-        'similar_products': similar_products,
-        'frequently_bought': frequently_bought,
+        'similar_products': bundle['similar_products'],
+        'frequently_bought': bundle['frequently_bought'],
     })
 
 
@@ -173,38 +207,25 @@ def add_to_cart_ajax(request, product_id):
         return JsonResponse({'success': False, 'redirect': '/login/'})
     
     product = get_object_or_404(Product, id=product_id)
-    cart, _ = Cart.objects.get_or_create(user=request.user)
 
     # Get the size from the AJAX request
     data = json.loads(request.body)
-    selected_size = data.get('size', None)
+    selected_size = data.get('size') or ''
 
-    # Check if cart item with same product AND size already exists
-    cart_item = CartItem.objects.filter(
-        cart=cart,
-        product=product,
-        size=selected_size
-    ).first()
+    # One insert that does nothing if this product AND size is already in the cart
+    _, created = add_cart_item(request, product, selected_size)
 
-    if cart_item:
+    if not created:
         # Item already exists in cart - don't allow adding again
         return JsonResponse({
             'success': False,
             'already_in_cart': True,
             'message': 'This item is already in your cart',
         })
-    
-    # Create new cart item
-    cart_item = CartItem.objects.create(
-        cart=cart,
-        product=product,
-        size=selected_size,
-        quantity=1
-    )
 
     return JsonResponse({
         'success': True,
-        'cart_count': cart.items.count(),
+        'cart_count': get_cart_count(request),
         'product_name': product.name,
     })
 
@@ -216,25 +237,16 @@ def buy_now_ajax(request, product_id):
         return JsonResponse({'success': False, 'redirect': '/login/'})
     
     product = get_object_or_404(Product, id=product_id)
-    cart, _ = Cart.objects.get_or_create(user=request.user)
 
     # Get the size from the AJAX request
     data = json.loads(request.body)
-    selected_size = data.get('size', None)
-
-    # Get or create cart item with same product AND size
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        product=product,
-        size=selected_size
-    )
+    selected_size = data.get('size') or ''
 
-    if not created:
-        cart_item.quantity += 1
-        cart_item.save()
+    # Insert the cart item, or add one to the quantity of the existing one
+    cart_item_id, _ = add_cart_item(request, product, selected_size, increment=True)
 
     # Store the specific cart item ID in session for buy now
-    request.session['buy_now_item_id'] = cart_item.id
+    request.session['buy_now_item_id'] = cart_item_id
 
     # Redirect to checkout
     return JsonResponse({
@@ -250,11 +262,44 @@ def cart_view(request):
     if 'buy_now_item_id' in request.session:
         del request.session['buy_now_item_id']
     
-    cart, _ = Cart.objects.get_or_create(user=request.user)
-    items = cart.items.all()
-    total = cart.total_price()
-    cart_count = cart.items.count() 
-    return render(request, 'cart.html', {'cart': cart, 'items': items, 'total': total, 'cart_count': cart_count,})
+    # Lines, line totals, total and count in one query; no cart means empty
+    summary = get_cart_summary(request.user)
+    cart_count = refresh_cart_count(request, summary.count)
+    return render(request, 'cart.html', {'items': summary.items, 'total': summary.total, 'cart_count': cart_count,})
+
+
+# Batched cart edits from the cart page
+@require_POST
+def cart_update(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'redirect': '/login/'})
+
+    try:
+        data = json.loads(request.body)
+        operations = data.get('operations') if isinstance(data, dict) else None
+        apply_cart_operations(request.user, operations)
+    except (json.JSONDecodeError, CartOperationError) as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+    except IntegrityError:
+        # Another request added the same product and size in the meantime
+        return JsonResponse({'success': False, 'message': 'Your cart changed, please try again'}, status=400)
+
+    # Send back the whole cart so the page can update in place
+    summary = get_cart_summary(request.user)
+    return JsonResponse({
+        'success': True,
+        'items': [{
+            'id': item.id,
+            'product_id': item.product_id,
+            'name': item.product.name,
+            'size': item.size,
+            'quantity': item.quantity,
+            'price': str(item.product.price),
+            'line_total': str(item.line_total),
+        } for item in summary.items],
+        'total': str(summary.total),
+        'cart_count': refresh_cart_count(request, summary.count),
+    })
 
 
 # Update item quantity
@@ -270,14 +315,24 @@ def update_cart_item(request, item_id):
         item.quantity = qty
     else:
         item.delete()
+        refresh_cart_count(request)
         return redirect('cart_view')
 
-    # Update size if passed in the form
+    # Update size if passed in the form; a line already in that size absorbs this one
     new_size = request.POST.get('size')
     if new_size:
-        item.size = new_size
+        try:
+            apply_cart_operations(request.user, [
+                {'op': 'set_quantity', 'item_id': item.id, 'quantity': qty},
+                {'op': 'set_size', 'item_id': item.id, 'size': new_size},
+            ])
+        except CartOperationError as e:
+            messages.error(request, str(e))
+        refresh_cart_count(request)
+        return redirect('cart_view')
 
     item.save()
+    refresh_cart_count(request)
     return redirect('cart_view')
 
 
@@ -287,34 +342,28 @@ def update_cart_item(request, item_id):
 def remove_cart_item(request, item_id):
     item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
     item.delete()
+    refresh_cart_count(request)
     return redirect('cart_view')
 
 
 # Checkout page
 @login_required
 def checkout_view(request):
-    cart, _ = Cart.objects.get_or_create(user=request.user)
-    
     # Check if this is a "Buy Now" checkout (only checkout specific item)
     buy_now_item_id = request.session.get('buy_now_item_id')
     
-    if buy_now_item_id:
-        # Only checkout the specific item from buy now
-        items = cart.items.filter(id=buy_now_item_id)
-    else:
-        # Regular checkout - show all cart items
-        items = cart.items.all()
-    
-    if not items.exists():
+    # Only the buy now item, or every cart item, with the totals worked out by the database
+    summary = get_cart_summary(request.user, buy_now_item_id)
+    items = summary.items
+    if not items:
         return redirect('cart_view')
     
     # Get user's saved addresses
     addresses = Address.objects.filter(user=request.user)
     default_address = addresses.filter(is_default=True).first()
     
-    # Calculate total only for items being checked out
-    total = sum(item.product.price * item.quantity for item in items)
-    shipping = 5
+    total = summary.total
+    shipping = SHIPPING_CHARGE
     grand_total = total + shipping
     
     if request.method == 'POST':
@@ -356,16 +405,11 @@ def checkout_view(request):
         
         if payment_method == 'khalti':
             # Initiate Khalti payment on server-side
-            purchase_order_id = f"ORDER-{request.user.id}-{cart.id}"
+            purchase_order_id = f"ORDER-{request.user.id}-{items[0].cart_id}"
             request.session['purchase_order_id'] = purchase_order_id
             
             amount_in_paisa = int(grand_total * 100)
             
-            headers = {
-                "Authorization": f"Key {settings.KHALTI_SECRET_KEY}",
-                "Content-Type": "application/json"
-            }
-            
             payload = {
                 "return_url": request.build_absolute_uri('/khalti-callback/'),
                 "website_url": request.build_absolute_uri('/'),
@@ -380,11 +424,7 @@ def checkout_view(request):
             }
             
             try:
-                response = requests.post(
-                    settings.KHALTI_INITIATE_URL,
-                    json=payload,
-                    headers=headers
-                )
+                response = khalti.initiate_payment(payload)
                 
                 if response.status_code == 200:
                     response_data = response.json()
@@ -400,8 +440,7 @@ def checkout_view(request):
                             'total': total,
                             'shipping': shipping,
                             'grand_total': grand_total,
-                            'cart': cart,
-                            'cart_count': items.count(),
+                            'cart_count': summary.count,
                             'khalti_public_key': settings.KHALTI_PUBLIC_KEY,
                             'addresses': addresses,
                             'default_address': default_address,
@@ -416,8 +455,7 @@ def checkout_view(request):
                         'total': total,
                         'shipping': shipping,
                         'grand_total': grand_total,
-                        'cart': cart,
-                        'cart_count': items.count(),
+                        'cart_count': summary.count,
                         'khalti_public_key': settings.KHALTI_PUBLIC_KEY,
                         'addresses': addresses,
                         'default_address': default_address,
@@ -431,8 +469,7 @@ def checkout_view(request):
                     'total': total,
                     'shipping': shipping,
                     'grand_total': grand_total,
-                    'cart': cart,
-                    'cart_count': items.count(),
+                    'cart_count': summary.count,
                     'khalti_public_key': settings.KHALTI_PUBLIC_KEY,
                     'addresses': addresses,
                     'default_address': default_address,
@@ -443,9 +480,10 @@ def checkout_view(request):
         
         # Handle COD orders
         elif payment_method == 'cod':
-            # Create order
-            order = Order.objects.create(
-                user=request.user,
+            # Create the order and clear the checked out items
+            order = place_order(
+                request,
+                buy_now_item_id,
                 first_name=first_name,
                 last_name=last_name,
                 email=email,
@@ -454,26 +492,13 @@ def checkout_view(request):
                 city=city,
                 postal_code=postal_code,
                 notes=request.POST.get('notes', ''),
-                total_amount=grand_total,
                 payment_method='cod',
-                status='pending'
+                status='pending',
+                confirmation_email=True
             )
-            
-            # Create order items
-            for item in items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=item.product,
-                    quantity=item.quantity,
-                    size=item.size,
-                    price=item.product.price
-                )
-            
-            # Clear the checked out items
-            items.delete()
-            
-            # Send order confirmation email
-            send_order_confirmation_email(order)
+            if order is None:
+                # Already placed from another tab
+                return redirect('cart_view')
             
             # Store order ID in session for order_success page
             request.session['last_order_id'] = order.id
@@ -489,8 +514,7 @@ def checkout_view(request):
         'total': total,
         'shipping': shipping,
         'grand_total': grand_total,
-        'cart': cart,
-        'cart_count': items.count(),
+        'cart_count': summary.count,
         'khalti_public_key': settings.KHALTI_PUBLIC_KEY,
         'addresses': addresses,
         'default_address': default_address,
@@ -509,33 +533,15 @@ def khalti_verify(request):
     billing_info = data.get('billing_info')
     saved_address_id = data.get('saved_address_id')
     
-    # Verify payment with Khalti
-    url = settings.KHALTI_VERIFY_URL
-    payload = {
-        "token": token,
-        "amount": amount
-    }
-    headers = {
-        "Authorization": f"Key {settings.KHALTI_SECRET_KEY}"
-    }
-    
     try:
-        response = requests.post(url, data=payload, headers=headers)
+        # Verify payment with Khalti
+        response = khalti.verify_payment(token, amount)
         response_data = response.json()
         
         if response.status_code == 200 and response_data.get('idx'):
             # Payment verified, create order
-            cart = Cart.objects.get(user=request.user)
-            
             # Check if this is a buy now checkout
             buy_now_item_id = request.session.get('buy_now_item_id')
-            if buy_now_item_id:
-                items = cart.items.filter(id=buy_now_item_id)
-            else:
-                items = cart.items.all()
-            
-            # Calculate total for items being checked out
-            total = sum(item.product.price * item.quantity for item in items) + 5  # Include shipping
             
             # Get address data
             if saved_address_id:
@@ -577,8 +583,10 @@ def khalti_verify(request):
                             is_default=Address.objects.filter(user=request.user).count() == 0
                         )
             
-            order = Order.objects.create(
-                user=request.user,
+            # Create the order and clear the checked out items
+            order = place_order(
+                request,
+                buy_now_item_id,
                 first_name=first_name,
                 last_name=last_name,
                 email=email,
@@ -587,26 +595,14 @@ def khalti_verify(request):
                 city=city,
                 postal_code=postal_code,
                 notes=billing_info.get('notes', ''),
-                total_amount=total,
                 payment_method='khalti',
                 payment_verified=True,
                 khalti_token=token,
                 khalti_transaction_id=response_data.get('idx'),
                 status='processing'
             )
-            
-            # Create order items
-            for item in items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=item.product,
-                    quantity=item.quantity,
-                    size=item.size,
-                    price=item.product.price
-                )
-            
-            # Clear the checked out items
-            items.delete()
+            if order is None:
+                return JsonResponse({'success': False, 'message': 'Your cart is empty'})
             
             # Clear buy now session flag
             if 'buy_now_item_id' in request.session:
@@ -630,20 +626,9 @@ def khalti_callback(request):
     purchase_order_id = request.GET.get('purchase_order_id')
     amount = request.GET.get('amount')
     
-    # Verify payment using lookup API
-    headers = {
-        "Authorization": f"Key {settings.KHALTI_SECRET_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {"pidx": pidx}
-    
     try:
-        response = requests.post(
-            settings.KHALTI_VERIFY_URL.replace('payment/verify', 'epayment/lookup'),
-            json=payload,
-            headers=headers
-        )
+        # Verify payment using lookup API
+        response = khalti.lookup_payment(pidx)
         
         if response.status_code == 200:
             verification_data = response.json()
@@ -653,22 +638,10 @@ def khalti_callback(request):
                 # Get billing info from session
                 billing = request.session.get('khalti_billing', {})
                 
-                # Get cart items
-                cart = Cart.objects.get(user=request.user)
-                buy_now_item_id = request.session.get('buy_now_item_id')
-                
-                if buy_now_item_id:
-                    items = cart.items.filter(id=buy_now_item_id)
-                else:
-                    items = cart.items.all()
-                
-                # Calculate total
-                total = sum(item.product.price * item.quantity for item in items)
-                grand_total = total + 5  # shipping
-                
-                # Create order
-                order = Order.objects.create(
-                    user=request.user,
+                # Create the order and clear the checked out items
+                order = place_order(
+                    request,
+                    request.session.get('buy_now_item_id'),
                     first_name=billing.get('first_name', request.user.first_name),
                     last_name=billing.get('last_name', request.user.last_name),
                     email=billing.get('email', request.user.email),
@@ -677,25 +650,15 @@ def khalti_callback(request):
                     city=billing.get('city'),
                     postal_code=billing.get('postal_code', ''),
                     notes=billing.get('notes', ''),
-                    total_amount=grand_total,
                     payment_method='khalti',
                     payment_verified=True,
                     khalti_transaction_id=transaction_id,
-                    status='processing'
+                    status='processing',
+                    confirmation_email=True
                 )
-                
-                # Create order items
-                for item in items:
-                    OrderItem.objects.create(
-                        order=order,
-                        product=item.product,
-                        quantity=item.quantity,
-                        size=item.size,
-                        price=item.product.price
-                    )
-                
-                # Send order confirmation email
-                send_order_confirmation_email(order)
+                if order is None:
+                    # Nothing left to check out; this callback was already handled
+                    return redirect('cart_view')
                 
                 # Save address if needed
                 saved_address_id = billing.get('saved_address_id')
@@ -710,9 +673,6 @@ def khalti_callback(request):
                         is_default=Address.objects.filter(user=request.user).count() == 0
                     )
                 
-                # Clear cart items
-                items.delete()
-                
                 # Store order ID in session for order_success page
                 request.session['last_order_id'] = order.id
                 
@@ -781,6 +741,7 @@ def cancel_order(request, order_id):
     if order.status == 'pending':
         order.status = 'cancelled'
         order.save()
+        record_order_status_change(order, previous_status='pending')
         messages.success(request, f'Order #{order.order_number} has been cancelled successfully.')
     else:
         messages.error(request, f'Order #{order.order_number} cannot be cancelled as it is already {order.get_status_display().lower()}.')
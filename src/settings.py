@@ -35,6 +35,27 @@ KHALTI_PUBLIC_KEY = config('KHALTI_PUBLIC_KEY', default='')
 KHALTI_SECRET_KEY = config('KHALTI_SECRET_KEY', default='')
 KHALTI_INITIATE_URL = config('KHALTI_INITIATE_URL', default='https://khalti.com/api/v2/epayment/initiate/')
 KHALTI_VERIFY_URL = config('KHALTI_VERIFY_URL', default='https://khalti.com/api/v2/payment/verify/')
+KHALTI_LOOKUP_URL = config('KHALTI_LOOKUP_URL', default=KHALTI_VERIFY_URL.replace('payment/verify', 'epayment/lookup'))
+# Seconds to connect and to wait for a reply (see shop/khalti.py)
+KHALTI_CONNECT_TIMEOUT = config('KHALTI_CONNECT_TIMEOUT', default=3.05, cast=float)
+KHALTI_READ_TIMEOUT = config('KHALTI_READ_TIMEOUT', default=10, cast=float)
+KHALTI_LOOKUP_RETRIES = config('KHALTI_LOOKUP_RETRIES', default=2, cast=int)
+KHALTI_POOL_SIZE = config('KHALTI_POOL_SIZE', default=10, cast=int)
+
+# Recommendations
+RECOMMENDATION_CACHE_TIMEOUT = config('RECOMMENDATION_CACHE_TIMEOUT', default=60 * 15, cast=int)  # seconds
+SIMILARITY_INDEX_PATH = config('SIMILARITY_INDEX_PATH', default=str(BASE_DIR / 'var' / 'product_neighbours.npy'))
+SIMILARITY_NEIGHBOURS = config('SIMILARITY_NEIGHBOURS', default=12, cast=int)
+
+# Shop facet counts and product detail bundles
+FACET_CACHE_TIMEOUT = config('FACET_CACHE_TIMEOUT', default=60 * 60, cast=int)  # seconds
+PRODUCT_CACHE_TIMEOUT = config('PRODUCT_CACHE_TIMEOUT', default=60 * 60, cast=int)  # seconds
+
+# Directory the image column of dashboard catalog uploads is relative to
+CATALOG_IMAGE_DIR = config('CATALOG_IMAGE_DIR', default=str(BASE_DIR / 'var' / 'catalog_images'))
+
+# Carts untouched for this long are cleared by manage.py cleanup_carts
+CART_RETENTION_DAYS = config('CART_RETENTION_DAYS', default=30, cast=int)
 
 
 # Application definition
@@ -51,6 +72,7 @@ INSTALLED_APPS = [
     'dog',
     'company',
     'dashboard',
+    'outbox',
 ]
 
 MIDDLEWARE = [
@@ -96,6 +118,23 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Cached data is keyed on or checked against the dataset version tokens, which
+# are kept in the database, or holds only ids that are re-read per request, so
+# every process sees invalidations even with the default per-process cache. A
+# shared backend saves recomputing per process and makes the dashboard's
+# recommendation hit rate cover all of them, e.g.
+# CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / 'var' / 'cache')),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -154,7 +193,13 @@ LOGOUT_REDIRECT_URL = 'home'
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = config('EMAIL_HOST', default='smtp.gmail.com')
 EMAIL_PORT = config('EMAIL_PORT', default=587, cast=int)
-EMAIL_USE_TLS = True
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@pethood.com')              
+
+# Email outbox: views queue mail, `manage.py send_outbox` sends it
+EMAIL_OUTBOX_BATCH_SIZE = config('EMAIL_OUTBOX_BATCH_SIZE', default=50, cast=int)
+EMAIL_OUTBOX_MAX_ATTEMPTS = config('EMAIL_OUTBOX_MAX_ATTEMPTS', default=6, cast=int)
+# Seconds before the first retry; doubles with each attempt
+EMAIL_OUTBOX_RETRY_DELAY = config('EMAIL_OUTBOX_RETRY_DELAY', default=60, cast=int)
@@ -7,11 +7,10 @@ from django.http import JsonResponse, HttpResponse
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
-from django.core.mail import send_mail
-from django.conf import settings
 from django.template.loader import render_to_string
 from .models import Address
 from shop.recommendations import get_trending_products, get_personalized_recommendations
+from outbox.mail import enqueue_email
 import random
 import string
 
@@ -73,16 +72,10 @@ def send_verification_email(user, request):
     """
     
     try:
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            fail_silently=False,
-        )
+        enqueue_email(subject, message, [user.email])
         return True
     except Exception as e:
-        print(f"Error sending email: {e}")
+        print(f"Error queueing email: {e}")
         return False
 
 def signinpage(request):